@@ -1,244 +1,1024 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, g
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import date, datetime, timedelta
 import os
-from functools import wraps
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import csv
-from io import StringIO
-
-# Initialize Flask app
-app = Flask(__name__)
-
-# Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'vaanyan-home-tuition-secret-key-2025')
-
-# Database Configuration - PostgreSQL for production, SQLite for local
-database_url = os.environ.get('DATABASE_URL')
-if database_url:
-    if database_url.startswith('postgres://'):
-        database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///vaanyan_tuition.db'
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Session Configuration
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=365)
-app.config['SESSION_COOKIE_SECURE'] = True
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-# Email Configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'mahapatravinayak@gmail.com')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'wrdb okdi macb zxim')
-app.config['ADMIN_EMAIL'] = os.environ.get('ADMIN_EMAIL', 'mahapatravinayak@gmail.com')
-
-# Initialize database
-db = SQLAlchemy(app)
-
-
-# ===== DATABASE MODELS =====
-
-class User(db.Model):
-    __tablename__ = 'users'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    role = db.Column(db.String(20), nullable=False)
-    first_name = db.Column(db.String(100), nullable=False)
-    last_name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    phone = db.Column(db.String(20), nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    student_profile = db.relationship('StudentProfile', backref='user', uselist=False, lazy=True)
-    teacher_profile = db.relationship('TeacherProfile', backref='user', uselist=False, lazy=True)
-    
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-    
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-
-class StudentProfile(db.Model):
-    __tablename__ = 'student_profiles'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    grade = db.Column(db.String(20), nullable=False)
-    board = db.Column(db.String(50), nullable=False)
-    subjects = db.Column(db.Text, nullable=False)
-    city = db.Column(db.String(100), nullable=False)
-    address = db.Column(db.Text, nullable=False)
-
-
-class TeacherProfile(db.Model):
-    __tablename__ = 'teacher_profiles'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    qualification = db.Column(db.String(100), nullable=False)
-    experience = db.Column(db.String(50), nullable=False)
-    subjects = db.Column(db.Text, nullable=False)
-    teaching_mode = db.Column(db.Text, nullable=False)
-    hourly_rate = db.Column(db.Integer, nullable=False)
-    bio = db.Column(db.Text)
-    city = db.Column(db.String(100), nullable=False)
-    address = db.Column(db.Text, nullable=False)
-    rating = db.Column(db.Float, default=5.0)
-    total_students = db.Column(db.Integer, default=0)
-    total_classes = db.Column(db.Integer, default=0)
-    total_earnings = db.Column(db.Integer, default=0)
-    is_verified = db.Column(db.Boolean, default=False)
-
-
-class TutorRequest(db.Model):
-    __tablename__ = 'tutor_requests'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    subject = db.Column(db.String(100), nullable=False)
-    message = db.Column(db.Text)
-    status = db.Column(db.String(20), default='pending')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    student = db.relationship('User', foreign_keys=[student_id], backref='sent_requests')
-    teacher = db.relationship('User', foreign_keys=[teacher_id], backref='received_requests')
-
-
-class Message(db.Model):
-    __tablename__ = 'messages'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
-    recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_messages')
-
-
-class Class(db.Model):
-    __tablename__ = 'classes'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    request_id = db.Column(db.Integer, db.ForeignKey('tutor_requests.id'), nullable=False)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    scheduled_at = db.Column(db.String(100), nullable=False)
-    duration_minutes = db.Column(db.Integer, default=60)
-    status = db.Column(db.String(20), default='scheduled')
-    meeting_link = db.Column(db.String(500))
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-
-class ClassSession(db.Model):
-    __tablename__ = 'class_sessions'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    request_id = db.Column(db.Integer, db.ForeignKey('tutor_requests.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    duration_hours = db.Column(db.Float, default=1.0)
-    hourly_rate = db.Column(db.Integer, nullable=False)
-    amount = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), default='completed')
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    student = db.relationship('User', foreign_keys=[student_id], backref='student_sessions')
-    teacher = db.relationship('User', foreign_keys=[teacher_id], backref='teacher_sessions')
-
-
-class PaymentCycle(db.Model):
-    __tablename__ = 'payment_cycles'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    start_date = db.Column(db.Date, nullable=False)
-    end_date = db.Column(db.Date)
-    total_classes = db.Column(db.Integer, default=0)
-    total_amount = db.Column(db.Integer, default=0)
-    commission = db.Column(db.Integer, default=0)
-    teacher_earning = db.Column(db.Integer, default=0)
-    status = db.Column(db.String(20), default='active')
-    payment_screenshot = db.Column(db.String(500))
-    payment_verified_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    student = db.relationship('User', foreign_keys=[student_id], backref='student_payments')
-    teacher = db.relationship('User', foreign_keys=[teacher_id], backref='teacher_payments')
+import io
+import zlib
+import atexit
+import base64
+import json
+import threading
+import time
+import traceback
+import uuid
+import click
+
+from config import config
+from models import (db, User, StudentProfile, TeacherProfile, TeacherSubject, TeacherMode, TutorRequest, Message,
+                    Conversation, ClassSession, PaymentCycle, EarningsRollup, Job, ServerSession, MetricCounter)
+from utils.background import BackgroundPool
+from utils.broker import LocalBroker
+from utils.decorators import login_required, role_required
+from utils.cache import TTLCache
+from utils.counters import CounterBuffer
+from utils.mailer import Mailer
+from utils.passwords import PasswordHasher
+from utils.ratelimit import RateLimiter, create_backend
+from utils.sessions import MemorySessionStore, ServerSideSessionInterface, SQLSessionStore
+from utils import exports
+from utils.uploads import UploadError, process_image, save_image_upload
+
+# Views register here and create_app() attaches them to each app it builds,
+# keeping endpoint names ('login', 'admin_dashboard', ...) unprefixed
+view_rules = []
+
+
+def route(rule, **options):
+    def decorator(f):
+        view_rules.append((rule, f, options))
+        return f
+    return decorator
+
+
+# Commands for `flask --app app <command>`, registered without a group prefix
+commands = Blueprint('commands', __name__, cli_group=None)
+
+
+def session_store():
+    """The server-side session store, or None when sessions live in the cookie."""
+    return getattr(current_app.session_interface, 'store', None)
 
 
 # ===== HELPER FUNCTIONS =====
 
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please login to access this page', 'error')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+def login_throttled(email):
+    """Count a login attempt against the client's IP and the email tried.
+
+    Returns 0 if it may go ahead, else the seconds to wait. Needs no
+    database access, so throttled attempts cost almost nothing.
+    """
+    limiter = current_app.extensions['rate_limiter']
+    return limiter.hit('login_ip', request.remote_addr or 'unknown') or limiter.hit('login_email', (email or '').strip().lower())
+
+
+def throttled_response(template, retry_after):
+    flash(f'Too many login attempts. Please try again in {retry_after} seconds.', 'error')
+    return render_template(template), 429, {'Retry-After': str(retry_after)}
+
+
+def regenerate_session():
+    """Issue a new server-side session id (no-op for cookie sessions) on login and logout.
+
+    Stops session fixation: an id planted in the browser before login never
+    becomes an authenticated session.
+    """
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
+
+
+def get_or_create(model, defaults=None, for_update=False, **keys):
+    """Return (row, created) for the `model` row matching keys, inserting it if missing.
+
+    The insert runs in a savepoint; if a unique constraint shows another
+    transaction inserted the same row first, that row is loaded instead.
+    """
+    query = model.query.filter_by(**keys)
+    if for_update:
+        query = query.with_for_update()
+    row = query.first()
+    if row:
+        return row, False
+    try:
+        with db.session.begin_nested():
+            row = model(**keys, **(defaults or {}))
+            db.session.add(row)
+        return row, True
+    except IntegrityError:
+        return query.one(), False
 
 
 def get_current_user():
-    if 'user_id' in session:
-        return User.query.get(session['user_id'])
-    return None
+    """Logged-in user, loaded once per request with the profile for their role."""
+    if 'user_id' not in session:
+        return None
+    if 'current_user' not in g:
+        query = User.query
+        if session.get('user_role') == 'student':
+            query = query.options(db.joinedload(User.student_profile))
+        elif session.get('user_role') == 'teacher':
+            query = query.options(db.joinedload(User.teacher_profile))
+        g.current_user = query.filter_by(id=session['user_id']).first()
+    return g.current_user
+
+
+def conversation_pair(user_id, partner_id):
+    return (user_id, partner_id) if user_id < partner_id else (partner_id, user_id)
+
+
+def record_message(sender_id, recipient_id, text):
+    """Add a message and update its conversation summary in the same transaction."""
+    message = Message(sender_id=sender_id, recipient_id=recipient_id, message=text, is_read=False)
+    db.session.add(message)
+    db.session.flush()
+    low, high = conversation_pair(sender_id, recipient_id)
+    conversation, _ = get_or_create(Conversation, {'unread_low': 0, 'unread_high': 0}, user_low_id=low, user_high_id=high)
+    conversation.last_message_id = message.id
+    conversation.last_message_at = message.created_at
+    if recipient_id == low:
+        conversation.unread_low = Conversation.unread_low + 1
+    else:
+        conversation.unread_high = Conversation.unread_high + 1
+    invalidate_unread_count(recipient_id)
+    bump_metric('messages')
+    return message
+
+
+def publish_message(payload):
+    """Push a committed message (as to_dict()) to both participants' open streams."""
+    broker = current_app.extensions['chat_broker']
+    for user_id in {payload['sender_id'], payload['recipient_id']}:
+        broker.publish(f'user:{user_id}', payload)
+
+
+def mark_conversation_read(user_id, partner_id):
+    Message.query.filter_by(sender_id=partner_id, recipient_id=user_id, is_read=False).update({'is_read': True})
+    low, high = conversation_pair(user_id, partner_id)
+    unread_column = 'unread_low' if user_id == low else 'unread_high'
+    Conversation.query.filter_by(user_low_id=low, user_high_id=high).update({unread_column: 0})
+    invalidate_unread_count(user_id)
+
+
+def encode_message_cursor(message):
+    return f"{message.created_at.isoformat()}_{message.id}"
+
+
+def decode_message_cursor(cursor):
+    try:
+        created_at, message_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        return None
+
+
+def thread_query(user_id, partner_id, before=None):
+    """Messages between two users, newest first, optionally older than a decoded cursor."""
+    query = Message.query.filter(((Message.sender_id == user_id) & (Message.recipient_id == partner_id)) | ((Message.sender_id == partner_id) & (Message.recipient_id == user_id)))
+    if before:
+        created_at, message_id = before
+        query = query.filter(db.or_(Message.created_at < created_at, db.and_(Message.created_at == created_at, Message.id < message_id)))
+    return query.order_by(Message.created_at.desc(), Message.id.desc())
+
+
+def get_thread_page(user_id, partner_id, before=None, limit=None):
+    """Most recent messages between two users, optionally older than a cursor.
+
+    Returns (messages oldest-first, cursor for the next older page or None).
+    """
+    limit = limit or current_app.config['CHAT_PAGE_SIZE']
+    messages = thread_query(user_id, partner_id, before).limit(limit + 1).all()
+    older_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        older_cursor = encode_message_cursor(messages[-1])
+    messages.reverse()
+    return messages, older_cursor
+
+
+def latest_message_query(user_id):
+    # One max() per side, each answered from the end of its (user, id) index
+    sides = db.union_all(db.select(db.func.max(Message.id).label('id')).where(Message.sender_id == user_id),
+                         db.select(db.func.max(Message.id).label('id')).where(Message.recipient_id == user_id)).subquery()
+    return db.session.query(db.func.coalesce(db.func.max(sides.c.id), 0))
+
+
+def latest_message_id(user_id):
+    """Highest id of any message sent to or by the user, 0 if none: where chat polls start."""
+    return latest_message_query(user_id).scalar()
+
+
+def new_messages_query(user_id, after):
+    # ix_messages_sender_id / ix_messages_recipient_id turn each side of the OR into an id range seek
+    return Message.query.options(db.joinedload(Message.sender)) \
+        .filter(db.or_(Message.sender_id == user_id, Message.recipient_id == user_id), Message.id > after) \
+        .order_by(Message.id).limit(current_app.config['CHAT_PAGE_SIZE'])
+
+
+def get_new_messages(user_id, after):
+    """Messages sent to or by the user with an id above `after`, oldest first, as dicts."""
+    return [message.to_dict() for message in new_messages_query(user_id, after)]
+
+
+def conversations_query(user_id, role):
+    """(partner, last message text, last message time, unread count) rows for a user's inbox."""
+    if role == 'student':
+        partner_ids = db.select(TutorRequest.teacher_id).where(TutorRequest.student_id == user_id, TutorRequest.status == 'accepted')
+    else:
+        partner_ids = db.select(TutorRequest.student_id).where(TutorRequest.teacher_id == user_id, TutorRequest.status == 'accepted')
+    is_low_side = Conversation.user_low_id == user_id
+    unread_count = db.case((is_low_side, Conversation.unread_low), else_=Conversation.unread_high)
+    return db.session.query(User, Message.message, Conversation.last_message_at, unread_count) \
+        .outerjoin(Conversation, db.or_(
+            db.and_(Conversation.user_low_id == user_id, Conversation.user_high_id == User.id),
+            db.and_(Conversation.user_high_id == user_id, Conversation.user_low_id == User.id),
+        )) \
+        .outerjoin(Message, Message.id == Conversation.last_message_id) \
+        .filter(User.id.in_(partner_ids)) \
+        .order_by(Conversation.last_message_at.is_(None), Conversation.last_message_at.desc(), User.id)
+
+
+def get_conversations(user):
+    """Inbox for the chat page, read from the conversation summary table.
+
+    Partners come from the user's accepted tutor requests; each is joined to
+    its summary row and last message, so the cost is one indexed query per
+    inbox regardless of how many messages have been exchanged.
+    """
+    rows = conversations_query(user.id, user.role).all()
+    return [{'partner': partner, 'last_message': last_message if last_message is not None else 'No messages yet', 'last_message_time': last_message_time, 'unread_count': unread_count or 0, 'id': partner.id} for partner, last_message, last_message_time, unread_count in rows]
+
+
+def rebuild_conversations():
+    """Recompute every conversation summary from the messages table."""
+    low = db.case((Message.sender_id < Message.recipient_id, Message.sender_id), else_=Message.recipient_id)
+    high = db.case((Message.sender_id < Message.recipient_id, Message.recipient_id), else_=Message.sender_id)
+
+    def unread(side):
+        return db.func.sum(db.case((db.and_(Message.recipient_id == side, Message.is_read == False), 1), else_=0))
+
+    ranked = db.select(
+        low.label('user_low_id'),
+        high.label('user_high_id'),
+        Message.id.label('message_id'),
+        Message.created_at,
+        db.func.row_number().over(partition_by=(low, high), order_by=(Message.created_at.desc(), Message.id.desc())).label('position'),
+        unread(low).over(partition_by=(low, high)).label('unread_low'),
+        unread(high).over(partition_by=(low, high)).label('unread_high'),
+    ).subquery()
+    rows = db.session.execute(db.select(ranked).where(ranked.c.position == 1)).all()
+    Conversation.query.delete()
+    db.session.add_all([Conversation(user_low_id=row.user_low_id, user_high_id=row.user_high_id, last_message_id=row.message_id, last_message_at=row.created_at, unread_low=row.unread_low, unread_high=row.unread_high) for row in rows])
+    db.session.commit()
+
+
+def admin_notification(subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = current_app.config['MAIL_USERNAME']
+    msg['To'] = current_app.config['ADMIN_EMAIL']
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg
 
 
 def send_admin_notification(subject, body):
+    """Queue an email to the admin as a job in the caller's transaction.
+
+    The job worker sends it after the commit and retries failed sends, so
+    a restart doesn't lose it the way an in-memory queue would.
+    """
+    return enqueue_job('send_admin_notification', subject=subject, body=body)
+
+
+# ===== DASHBOARD DATA =====
+
+def invalidate_cached(key):
+    """Drop a dashboard_cache key once the current transaction commits.
+
+    Dropping it earlier would let a request that reads before the commit
+    cache the old value again.
+    """
+    db.session.info.setdefault('cache_invalidations', set()).add(key)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def drop_committed_cache_keys(session):
+    # Releasing a savepoint fires this too; wait for the outer commit
+    if session.in_nested_transaction():
+        return
+    cache = current_app.extensions['dashboard_cache']
+    for key in session.info.pop('cache_invalidations', ()):
+        cache.delete(key)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def discard_rolled_back_cache_keys(session, previous_transaction):
+    # As for metric deltas, only the outermost rollback drops them
+    if previous_transaction.parent is None:
+        session.info.pop('cache_invalidations', None)
+
+
+def get_admin_ids():
+    """Ids of all admin users, cached process-wide."""
+    def load():
+        return sorted(admin_id for admin_id, in db.session.query(User.id).filter_by(role='admin'))
+    return current_app.extensions['dashboard_cache'].get_or_set('admin_ids', load, ttl=current_app.config['ADMIN_IDS_CACHE_TTL'])
+
+
+@db.event.listens_for(User, 'after_insert')
+def invalidate_admin_ids(mapper, connection, target):
+    if target.role == 'admin':
+        invalidate_cached('admin_ids')
+
+
+def unread_count_query(user_id):
+    unread = db.case((Conversation.user_low_id == user_id, Conversation.unread_low), else_=Conversation.unread_high)
+    return db.session.query(db.func.coalesce(db.func.sum(unread), 0)).filter(db.or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id))
+
+
+def get_unread_count(user_id):
+    """Unread messages for a user, summed from the conversation summaries."""
+    return current_app.extensions['dashboard_cache'].get_or_set(f'unread:{user_id}', lambda: unread_count_query(user_id).scalar())
+
+
+def invalidate_unread_count(user_id):
+    invalidate_cached(f'unread:{user_id}')
+
+
+def get_admin_messages(user_id, limit=10):
+    return Message.query.filter(Message.recipient_id == user_id, Message.sender_id.in_(get_admin_ids())).order_by(Message.created_at.desc()).limit(limit).all()
+
+
+def student_dashboard_data(user):
+    tutors = []
+    if user.student_profile:
+        tutors = User.query.join(TeacherProfile).options(db.contains_eager(User.teacher_profile)).filter(User.role == 'teacher', TeacherProfile.city == user.student_profile.city).limit(6).all()
+    return {
+        'tutors': tutors,
+        'classes': [],
+        'messages': range(get_unread_count(user.id)),
+        'admin_messages': get_admin_messages(user.id),
+    }
+
+
+def teacher_dashboard_data(user):
+    pending_requests = TutorRequest.query.options(db.joinedload(TutorRequest.student).joinedload(User.student_profile)).filter_by(teacher_id=user.id, status='pending').all()
+    students = User.query.join(TutorRequest, TutorRequest.student_id == User.id) \
+        .options(db.joinedload(User.student_profile)) \
+        .filter(TutorRequest.teacher_id == user.id, TutorRequest.status == 'accepted') \
+        .distinct().all()
+    return {
+        'pending_requests': pending_requests,
+        'students': students,
+        'classes': [],
+        'monthly_earnings': user.teacher_profile.total_earnings if user.teacher_profile else 0,
+        'messages': range(get_unread_count(user.id)),
+        'admin_messages': get_admin_messages(user.id),
+    }
+
+
+# ===== METRICS =====
+
+# Counters shown on the admin dashboard, kept current by the write paths
+# that change them and periodically reconciled against the real tables.
+METRIC_QUERIES = {
+    'students': lambda: User.query.filter_by(role='student').count(),
+    'teachers': lambda: User.query.filter_by(role='teacher').count(),
+    'connections': lambda: TutorRequest.query.filter_by(status='accepted').count(),
+    'messages': lambda: Message.query.count(),
+}
+
+
+def bump_metric(name, delta=1):
+    """Count a change to a metric once the caller's transaction commits.
+
+    Deltas collect in a per-process buffer that flush_metrics() writes at
+    most every METRICS_FLUSH_INTERVAL seconds, so busy write paths (every
+    chat message) don't all queue on the same metric_counters row.
+    """
+    deltas = db.session.info.setdefault('metric_deltas', {})
+    deltas[name] = deltas.get(name, 0) + delta
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def buffer_committed_metrics(session):
+    # Releasing a savepoint fires this too; only the outer commit makes the deltas real
+    if session.in_nested_transaction():
+        return
+    deltas = session.info.pop('metric_deltas', None)
+    if deltas:
+        current_app.extensions['metric_buffer'].add(deltas)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def discard_rolled_back_metrics(session, previous_transaction):
+    # Savepoints (get_or_create) and failed flushes roll back inner transactions; only the outermost one drops the deltas
+    if previous_transaction.parent is None:
+        session.info.pop('metric_deltas', None)
+
+
+def write_metric_deltas(batches):
+    """Add buffered (committed_at, deltas) batches to the stored counters.
+
+    A batch committed before a counter's reconciled_at is already in that
+    recount, so it is skipped for that counter rather than counted twice.
+    Commit and reconcile times come from different processes' clocks, so
+    this relies on them being roughly in sync; the next reconcile fixes
+    any small drift.
+    """
+    table = MetricCounter.__table__
+    names = sorted({name for _, deltas in batches for name in deltas})
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        # Row locks (PostgreSQL) keep a concurrent reconcile from moving reconciled_at mid-write
+        reconciled = dict(connection.execute(db.select(table.c.name, table.c.reconciled_at).where(table.c.name.in_(names)).with_for_update()).all())
+        for name in names:
+            since = reconciled.get(name)
+            delta = sum(deltas.get(name, 0) for committed_at, deltas in batches if since is None or committed_at > since)
+            if delta and not connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + delta, updated_at=now)).rowcount:
+                connection.execute(table.insert().values(name=name, value=delta, updated_at=now))
+
+
+def flush_metrics(exception=None, force=False):
+    """Write the buffered metric deltas if they are due (an app context teardown hook)."""
+    buffer = current_app.extensions['metric_buffer']
+    batches = buffer.drain(0 if force else current_app.config['METRICS_FLUSH_INTERVAL'])
+    if not batches:
+        return
     try:
-        msg = MIMEMultipart()
-        msg['From'] = app.config['MAIL_USERNAME']
-        msg['To'] = app.config['ADMIN_EMAIL']
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-        server = smtplib.SMTP(app.config['MAIL_SERVER'], app.config['MAIL_PORT'])
-        server.starttls()
-        server.login(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email failed: {e}")
-        return False
+        write_metric_deltas(batches)
+    except Exception:
+        # Keep them for the next flush; reconcile_metrics corrects any drift
+        buffer.restore(batches)
+        current_app.logger.exception('Writing metric counters failed')
+
+
+def flush_metrics_at_exit(app):
+    """Write whatever is still buffered when a web or job worker process exits."""
+    with app.app_context():
+        flush_metrics(force=True)
+
+
+def get_metrics():
+    values = dict(db.session.query(MetricCounter.name, MetricCounter.value))
+    return {name: values.get(name, 0) for name in METRIC_QUERIES}
+
+
+def reconcile_metrics():
+    """Recount every metric from its table and overwrite the stored value.
+
+    Other processes may still hold buffered deltas for rows this recount
+    includes; reconciled_at records when the count was taken so their
+    flushes skip those deltas (see write_metric_deltas).
+    """
+    flush_metrics(force=True)
+    for name, count in METRIC_QUERIES.items():
+        # Taken before counting: everything committed earlier is in the count
+        reconciled_at = datetime.utcnow()
+        value = count()
+        changes = {'value': value, 'reconciled_at': reconciled_at, 'updated_at': datetime.utcnow()}
+        if not MetricCounter.query.filter_by(name=name).update(changes, synchronize_session=False):
+            db.session.add(MetricCounter(name=name, **changes))
+    db.session.commit()
+
+
+# ===== EARNINGS =====
+
+PENDING_PAYMENT_STATUSES = ('pending_payment', 'pending_verification')
+
+
+def month_start(moment):
+    return date(moment.year, moment.month, 1)
+
+
+def next_month(start):
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def cycle_totals(*criteria):
+    """SUM the money columns of the matching cycles per status: {status: {'teacher_earning': .., 'commission': ..}}."""
+    rows = (db.session.query(PaymentCycle.status,
+                             db.func.coalesce(db.func.sum(PaymentCycle.teacher_earning), 0),
+                             db.func.coalesce(db.func.sum(PaymentCycle.commission), 0))
+            .filter(*criteria)
+            .group_by(PaymentCycle.status)
+            .all())
+    return {status: {'teacher_earning': earning, 'commission': commission} for status, earning, commission in rows}
+
+
+def refresh_earnings_rollup(teacher_id, moment):
+    """Recompute one teacher's paid totals for the month containing `moment` from payment_cycles."""
+    start = month_start(moment)
+    end = next_month(start)
+    totals = (db.session.query(db.func.count(PaymentCycle.id),
+                               db.func.coalesce(db.func.sum(PaymentCycle.total_classes), 0),
+                               db.func.coalesce(db.func.sum(PaymentCycle.total_amount), 0),
+                               db.func.coalesce(db.func.sum(PaymentCycle.commission), 0),
+                               db.func.coalesce(db.func.sum(PaymentCycle.teacher_earning), 0))
+              .filter(PaymentCycle.teacher_id == teacher_id, PaymentCycle.status == 'paid',
+                      PaymentCycle.payment_verified_at >= datetime.combine(start, datetime.min.time()),
+                      PaymentCycle.payment_verified_at < datetime.combine(end, datetime.min.time()))
+              .one())
+    rollup, _ = get_or_create(EarningsRollup, teacher_id=teacher_id, month=start)
+    rollup.paid_cycles, rollup.total_classes, rollup.total_amount, rollup.commission, rollup.teacher_earning = totals
+    return rollup
+
+
+def rebuild_earnings_rollups():
+    """Recompute every monthly rollup from the paid payment cycles."""
+    months = {}
+    paid = (db.session.query(PaymentCycle.teacher_id, PaymentCycle.payment_verified_at, PaymentCycle.total_classes,
+                             PaymentCycle.total_amount, PaymentCycle.commission, PaymentCycle.teacher_earning)
+            .filter(PaymentCycle.status == 'paid', PaymentCycle.payment_verified_at.isnot(None))
+            .yield_per(current_app.config['EXPORT_BATCH_SIZE']))
+    for teacher_id, verified_at, classes, amount, commission, earning in paid:
+        totals = months.setdefault((teacher_id, month_start(verified_at)), [0, 0, 0, 0, 0])
+        for i, value in enumerate((1, classes, amount, commission, earning)):
+            totals[i] += value or 0
+    EarningsRollup.query.delete()
+    db.session.add_all([EarningsRollup(teacher_id=teacher_id, month=month, paid_cycles=totals[0], total_classes=totals[1], total_amount=totals[2], commission=totals[3], teacher_earning=totals[4])
+                        for (teacher_id, month), totals in months.items()])
+    db.session.commit()
+
+
+# ===== CLASS LOGGING =====
+
+CLASSES_PER_CYCLE = 25
+
+
+def get_active_cycle(student_id, teacher_id):
+    """Return the pair's active cycle, row-locked where the database supports it, creating it if needed."""
+    # uq_payment_cycles_active_pair makes a concurrent opener load ours instead
+    cycle, _ = get_or_create(PaymentCycle, {'start_date': datetime.utcnow().date(), 'total_classes': 0, 'total_amount': 0, 'commission': 0, 'teacher_earning': 0},
+                             for_update=True, student_id=student_id, teacher_id=teacher_id, status='active')
+    return cycle
+
+
+def bill_classes(student_id, teacher_id, amounts):
+    """Bill class amounts, in order, to the pair's payment cycles.
+
+    Each cycle is topped up with one UPDATE of SQL-side increments and is
+    closed once it holds CLASSES_PER_CYCLE classes, the remainder rolling
+    into a freshly opened cycle. The UPDATE only applies if total_classes
+    is still what was read, so a concurrent writer makes us re-read rather
+    than overfill a cycle.
+    """
+    pending = list(amounts)
+    retries = 0
+    while pending:
+        cycle = get_active_cycle(student_id, teacher_id)
+        billed = cycle.total_classes or 0
+        chunk = pending[:max(CLASSES_PER_CYCLE - billed, 1)]
+        total_classes = PaymentCycle.total_classes + len(chunk)
+        total_amount = PaymentCycle.total_amount + sum(chunk)
+        commission = total_amount // 10
+        full = total_classes >= CLASSES_PER_CYCLE
+        updated = PaymentCycle.query.filter_by(id=cycle.id, status='active', total_classes=billed).update({
+            'total_classes': total_classes,
+            'total_amount': total_amount,
+            'commission': commission,
+            'teacher_earning': total_amount - commission,
+            'status': db.case((full, 'pending_payment'), else_=PaymentCycle.status),
+            'end_date': db.case((full, datetime.utcnow().date()), else_=PaymentCycle.end_date),
+        }, synchronize_session=False)
+        db.session.expire(cycle)
+        if updated:
+            pending = pending[len(chunk):]
+            retries = 0
+        else:
+            retries += 1
+            if retries > 3:
+                raise RuntimeError(f'Could not update the payment cycle for student {student_id} and teacher {teacher_id}')
+
+
+def log_class_session(teacher, student_id, request_id, class_date, duration, notes='', idempotency_key=None):
+    """Record a class and bill it to the active cycle.
+
+    Returns (session, created); created is False when idempotency_key was
+    already used by this teacher, in which case nothing is billed again.
+    """
+    hourly_rate = teacher.teacher_profile.hourly_rate
+    amount = int(duration * hourly_rate)
+    fields = {'student_id': student_id, 'request_id': request_id, 'date': class_date, 'duration_hours': duration, 'hourly_rate': hourly_rate, 'amount': amount, 'notes': notes}
+    if idempotency_key:
+        session_record, created = get_or_create(ClassSession, fields, teacher_id=teacher.id, idempotency_key=idempotency_key)
+        if not created:
+            return session_record, False
+    else:
+        session_record = ClassSession(teacher_id=teacher.id, **fields)
+        db.session.add(session_record)
+    bill_classes(student_id, teacher.id, [amount])
+    return session_record, True
+
+
+def parse_class_entries(rows, request_ids):
+    """Validate raw bulk-log rows (dicts) against the teacher's accepted students.
+
+    request_ids maps student id to the accepted request id. Returns
+    (entries, errors); errors name the 1-based row they refer to.
+    """
+    entries = []
+    errors = []
+    keys = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(f'Row {number}: expected an object')
+            continue
+        try:
+            student_id = int(row.get('student_id'))
+        except (TypeError, ValueError):
+            errors.append(f'Row {number}: student_id is required')
+            continue
+        if student_id not in request_ids:
+            errors.append(f'Row {number}: student {student_id} is not one of your students')
+            continue
+        try:
+            class_date = datetime.strptime(str(row.get('date') or row.get('class_date') or ''), '%Y-%m-%d').date()
+        except ValueError:
+            errors.append(f'Row {number}: date must be YYYY-MM-DD')
+            continue
+        try:
+            duration = float(row.get('duration') or 1)
+        except (TypeError, ValueError):
+            duration = 0
+        if not 0 < duration <= 12:
+            errors.append(f'Row {number}: duration must be between 0 and 12 hours')
+            continue
+        key = str(row.get('idempotency_key') or '').strip()[:64] or None
+        if key:
+            if key in keys:
+                errors.append(f'Row {number}: idempotency_key {key} is repeated')
+                continue
+            keys.add(key)
+        entries.append({'student_id': student_id, 'request_id': request_ids[student_id], 'date': class_date, 'duration': duration, 'notes': str(row.get('notes') or ''), 'idempotency_key': key})
+    return entries, errors
+
+
+def log_class_sessions(teacher, entries):
+    """Insert many validated class sessions and bill them in one transaction.
+
+    Entries whose idempotency_key was already used are skipped. Returns
+    (logged, skipped) counts; the caller commits.
+    """
+    keys = [entry['idempotency_key'] for entry in entries if entry['idempotency_key']]
+    used = set()
+    if keys:
+        used = {key for key, in db.session.query(ClassSession.idempotency_key).filter(ClassSession.teacher_id == teacher.id, ClassSession.idempotency_key.in_(keys))}
+    fresh = sorted((entry for entry in entries if entry['idempotency_key'] not in used), key=lambda entry: (entry['student_id'], entry['date']))
+    hourly_rate = teacher.teacher_profile.hourly_rate
+    amounts = {}
+    sessions = []
+    for entry in fresh:
+        amount = int(entry['duration'] * hourly_rate)
+        amounts.setdefault(entry['student_id'], []).append(amount)
+        sessions.append(ClassSession(student_id=entry['student_id'], teacher_id=teacher.id, request_id=entry['request_id'], date=entry['date'], duration_hours=entry['duration'], hourly_rate=hourly_rate, amount=amount, notes=entry['notes'], idempotency_key=entry['idempotency_key']))
+    db.session.add_all(sessions)
+    db.session.flush()
+    for student_id, student_amounts in amounts.items():
+        bill_classes(student_id, teacher.id, student_amounts)
+    return len(sessions), len(entries) - len(sessions)
+
+
+def merge_duplicate_active_cycles(connection):
+    """Fold extra active cycles for a pair into the oldest one so uq_payment_cycles_active_pair can be built."""
+    cycles = PaymentCycle.__table__
+    pairs = connection.execute(db.select(cycles.c.student_id, cycles.c.teacher_id)
+                               .where(cycles.c.status == 'active')
+                               .group_by(cycles.c.student_id, cycles.c.teacher_id)
+                               .having(db.func.count() > 1)).all()
+    for student_id, teacher_id in pairs:
+        rows = connection.execute(db.select(cycles.c.id, cycles.c.total_classes, cycles.c.total_amount)
+                                  .where(cycles.c.student_id == student_id, cycles.c.teacher_id == teacher_id, cycles.c.status == 'active')
+                                  .order_by(cycles.c.id)).all()
+        total_classes = sum(row.total_classes or 0 for row in rows)
+        total_amount = sum(row.total_amount or 0 for row in rows)
+        commission = total_amount // 10
+        connection.execute(cycles.update().where(cycles.c.id == rows[0].id).values(total_classes=total_classes, total_amount=total_amount, commission=commission, teacher_earning=total_amount - commission))
+        connection.execute(cycles.delete().where(cycles.c.id.in_([row.id for row in rows[1:]])))
+
+
+# ===== TUTOR SEARCH =====
+
+def normalize_search_term(value):
+    return value.strip().lower().replace(' ', '_')
+
+
+def split_search_terms(value):
+    terms = []
+    for part in (value or '').split(','):
+        term = normalize_search_term(part)
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _sync_terms(collection, model, field, values):
+    wanted = set(values)
+    for term in list(collection):
+        value = getattr(term, field)
+        if value in wanted:
+            wanted.discard(value)
+        else:
+            collection.remove(term)
+    for value in sorted(wanted):
+        collection.append(model(**{field: value}))
+
+
+def sync_teacher_search_terms(profile):
+    """Refresh the subject/mode lookup rows from the profile's comma-joined fields."""
+    _sync_terms(profile.subject_terms, TeacherSubject, 'subject', split_search_terms(profile.subjects))
+    _sync_terms(profile.mode_terms, TeacherMode, 'mode', split_search_terms(profile.teaching_mode))
+
+
+def rebuild_search_index():
+    """Backfill lookup rows for every teacher profile (existing databases)."""
+    for profile in TeacherProfile.query.all():
+        sync_teacher_search_terms(profile)
+    db.session.commit()
+
+
+def search_tutors(city='', subject='', mode='', max_price=None):
+    """Build the tutor search query; every predicate is served by an index."""
+    query = User.query.join(TeacherProfile).options(db.contains_eager(User.teacher_profile)).filter(User.role == 'teacher')
+    if city:
+        query = query.filter(db.func.lower(TeacherProfile.city) == city.strip().lower())
+    if subject:
+        subject_ids = db.select(TeacherSubject.teacher_profile_id).where(TeacherSubject.subject == normalize_search_term(subject))
+        query = query.filter(TeacherProfile.id.in_(subject_ids))
+    if mode:
+        # 'both' in the search form means tutors offering home tuition and online classes
+        modes = ['home_tuition', 'online'] if normalize_search_term(mode) == 'both' else [normalize_search_term(mode)]
+        for term in modes:
+            mode_ids = db.select(TeacherMode.teacher_profile_id).where(TeacherMode.mode == term)
+            query = query.filter(TeacherProfile.id.in_(mode_ids))
+    if max_price is not None:
+        query = query.filter(TeacherProfile.hourly_rate <= max_price)
+    return query
+
+
+def encode_search_cursor(profile):
+    raw = f"{int(bool(profile.is_verified))}:{profile.rating}:{profile.hourly_rate}:{profile.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        verified, rating, hourly_rate, profile_id = raw.split(':')
+        return bool(int(verified)), float(rating), int(hourly_rate), int(profile_id)
+    except ValueError:
+        return None
+
+
+def after_search_cursor(verified, rating, hourly_rate, profile_id):
+    """Tutors ranked after the cursor within its own is_verified group.
+
+    The redundant rating bound gives the database a range on
+    ix_teacher_profiles_rank to seek into; the OR alone can't be.
+    """
+    return db.and_(
+        TeacherProfile.is_verified == verified,
+        TeacherProfile.rating <= rating,
+        db.or_(TeacherProfile.rating < rating,
+               db.and_(TeacherProfile.rating == rating, TeacherProfile.hourly_rate > hourly_rate),
+               db.and_(TeacherProfile.rating == rating, TeacherProfile.hourly_rate == hourly_rate, TeacherProfile.id > profile_id)),
+    )
+
+
+def rank_tutors(query):
+    """Order a tutor query verified first, then by rating, then by price (ix_teacher_profiles_rank)."""
+    return query.order_by(TeacherProfile.is_verified.desc(), TeacherProfile.rating.desc(), TeacherProfile.hourly_rate.asc(), TeacherProfile.id.asc())
+
+
+def paginate_tutors(query, after=None, per_page=None):
+    """Keyset-paginate a tutor query ranked verified first, then rating, then price.
+
+    Returns (tutors, next_cursor); next_cursor is None on the last page.
+    """
+    per_page = per_page or current_app.config['ITEMS_PER_PAGE']
+    query = rank_tutors(query)
+    cursor = decode_search_cursor(after) if after else None
+    if cursor:
+        tutors = query.filter(after_search_cursor(*cursor)).limit(per_page + 1).all()
+        if cursor[0] and len(tutors) <= per_page:
+            # The verified tutors ran out; the unverified ones follow from the top
+            tutors += query.filter(TeacherProfile.is_verified == False).limit(per_page + 1 - len(tutors)).all()
+    else:
+        tutors = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(tutors) > per_page:
+        tutors = tutors[:per_page]
+        next_cursor = encode_search_cursor(tutors[-1].teacher_profile)
+    return tutors, next_cursor
+
+
+# ===== ADMIN LISTINGS =====
+
+def filter_admin_users(query, profile_model, name='', email='', city=''):
+    """Case-insensitive substring filters shared by the admin user listings."""
+    if name:
+        full_name = db.func.lower(User.first_name + ' ' + User.last_name)
+        query = query.filter(full_name.contains(name.strip().lower(), autoescape=True))
+    if email:
+        query = query.filter(db.func.lower(User.email).contains(email.strip().lower(), autoescape=True))
+    if city:
+        query = query.filter(db.func.lower(profile_model.city).contains(city.strip().lower(), autoescape=True))
+    return query
+
+
+def accepted_partners_query(user_column, partner_column, user_ids):
+    return (db.session.query(user_column, User)
+            .join(User, User.id == partner_column)
+            .filter(TutorRequest.status == 'accepted', user_column.in_(user_ids))
+            .order_by(TutorRequest.id))
+
+
+def accepted_partners(user_column, partner_column, user_ids):
+    """Map each user id to the users they have an accepted request with, in one query."""
+    partners = {}
+    if not user_ids:
+        return partners
+    for user_id, partner in accepted_partners_query(user_column, partner_column, user_ids):
+        partners.setdefault(user_id, []).append(partner)
+    return partners
+
+
+def admin_students_query(**filters):
+    query = (User.query.outerjoin(User.student_profile)
+             .options(db.contains_eager(User.student_profile))
+             .filter(User.role == 'student'))
+    return filter_admin_users(query, StudentProfile, **filters).order_by(User.id)
+
+
+def admin_teachers_query(**filters):
+    total_earnings = db.func.coalesce(TeacherProfile.total_earnings, 0)
+    query = (db.session.query(User, total_earnings, total_earnings // 10)
+             .outerjoin(User.teacher_profile)
+             .options(db.contains_eager(User.teacher_profile))
+             .filter(User.role == 'teacher'))
+    return filter_admin_users(query, TeacherProfile, **filters).order_by(User.id)
+
+
+def admin_student_listing(page=1, **filters):
+    pagination = admin_students_query(**filters).paginate(page=page, per_page=current_app.config['ITEMS_PER_PAGE'], error_out=False)
+    # One row per accepted request of this page's students, so it doubles as their connection count
+    teachers = accepted_partners(TutorRequest.student_id, TutorRequest.teacher_id, [student.id for student in pagination.items])
+    student_data = [{'student': student, 'teachers': teachers.get(student.id, []), 'total_classes': len(teachers.get(student.id, []))} for student in pagination.items]
+    return student_data, pagination
+
+
+def admin_teacher_listing(page=1, **filters):
+    pagination = admin_teachers_query(**filters).paginate(page=page, per_page=current_app.config['ITEMS_PER_PAGE'], error_out=False)
+    students = accepted_partners(TutorRequest.teacher_id, TutorRequest.student_id, [teacher.id for teacher, *_ in pagination.items])
+    teacher_data = [{'teacher': teacher, 'students': students.get(teacher.id, []), 'total_students': len(students.get(teacher.id, [])), 'total_earnings': earnings, 'commission': commission}
+                    for teacher, earnings, commission in pagination.items]
+    return teacher_data, pagination
+
+
+# ===== BACKGROUND JOBS =====
+
+job_handlers = {}
+
+# Jobs that re-run forever, each mapped to the config key holding its interval in seconds
+periodic_jobs = {'reconcile_metrics': 'METRICS_RECONCILE_INTERVAL', 'cleanup_sessions': 'SESSION_CLEANUP_INTERVAL'}
+
+
+def job_handler(name):
+    """Register a function as the handler for jobs called `name`."""
+    def decorator(f):
+        job_handlers[name] = f
+        return f
+    return decorator
+
+
+def enqueue_job(name, delay_seconds=0, max_attempts=3, **payload):
+    """Add a job to the current transaction; it becomes visible on commit."""
+    job = Job(name=name, payload=json.dumps(payload), max_attempts=max_attempts, run_at=datetime.utcnow() + timedelta(seconds=delay_seconds))
+    db.session.add(job)
+    return job
+
+
+def enqueue_periodic_job(name, delay_seconds=0):
+    """Queue the next run of a periodic job unless one is already queued.
+
+    uq_jobs_periodic_queued allows one queued row per periodic job, so
+    workers seeding or rescheduling at the same moment can't start a
+    second chain. Periodic jobs aren't retried; the next run takes over.
+    """
+    get_or_create(Job, {'payload': '{}', 'max_attempts': 1, 'run_at': datetime.utcnow() + timedelta(seconds=delay_seconds)},
+                  name=name, status='queued', periodic=True)
+
+
+def claim_jobs(worker_id, limit):
+    """Atomically mark up to `limit` due jobs as running for this worker."""
+    now = datetime.utcnow()
+    claim = {'status': 'running', 'locked_by': worker_id, 'started_at': now, 'attempts': Job.attempts + 1}
+    due = Job.query.filter(Job.status == 'queued', Job.run_at <= now).order_by(Job.run_at, Job.id).limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        job_ids = [job.id for job in due.with_for_update(skip_locked=True)]
+        if job_ids:
+            Job.query.filter(Job.id.in_(job_ids)).update(claim, synchronize_session=False)
+    else:
+        # No row locks on SQLite: claim each candidate with a compare-and-set update
+        job_ids = [job_id for job_id, in due.with_entities(Job.id)
+                   if Job.query.filter_by(id=job_id, status='queued').update(claim, synchronize_session=False)]
+    db.session.commit()
+    return job_ids
+
+
+def run_job(job_id):
+    """Execute one claimed job and record its timing and outcome."""
+    job = db.session.get(Job, job_id)
+    handler = job_handlers.get(job.name)
+    started = time.monotonic()
+    try:
+        if not handler:
+            raise LookupError(f'No handler registered for job {job.name!r}')
+        handler(**json.loads(job.payload))
+        job.status = 'done'
+        job.last_error = None
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=10 * 2 ** job.attempts)
+        else:
+            job.status = 'failed'
+    job.finished_at = datetime.utcnow()
+    job.duration_ms = int((time.monotonic() - started) * 1000)
+    job.locked_by = None
+    if job.name in periodic_jobs:
+        # Whether this run worked or not, in the same commit that finishes it
+        enqueue_periodic_job(job.name, delay_seconds=current_app.config[periodic_jobs[job.name]])
+    db.session.commit()
+    return job.status
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run, failing those out of attempts.
+
+    claim_jobs counts each claim as an attempt, so a job that keeps killing
+    its worker is given up on instead of being retried forever.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+    stale = Job.query.filter(Job.status == 'running', Job.started_at < cutoff)
+    now = datetime.utcnow()
+    failed = stale.filter(Job.attempts >= Job.max_attempts).update(
+        {'status': 'failed', 'locked_by': None, 'finished_at': now, 'last_error': 'Worker stopped while running the job'}, synchronize_session=False)
+    count = stale.update({'status': 'queued', 'locked_by': None}, synchronize_session=False)
+    db.session.commit()
+    if failed:
+        current_app.logger.warning('Failed %d stale jobs that were out of attempts', failed)
+    return count
+
+
+@job_handler('send_admin_notification')
+def send_admin_notification_job(subject, body):
+    # SMTP errors propagate, so a failed send fails the job and run_job retries it
+    current_app.extensions['mailer'].send(admin_notification(subject, body))
+
+
+@job_handler('reconcile_metrics')
+def reconcile_metrics_job():
+    reconcile_metrics()
+
+
+@job_handler('cleanup_sessions')
+def cleanup_sessions_job():
+    store = session_store()
+    if store:
+        store.cleanup(current_app.config['SESSION_CLEANUP_BATCH'])
+
+
+def schedule_periodic_jobs():
+    """Queue any periodic job that is neither queued nor running.
+
+    run_job queues each next run itself; the worker calls this on every
+    poll so a chain broken by a crashed worker starts again.
+    """
+    active = {name for name, in db.session.query(Job.name).filter(Job.name.in_(periodic_jobs), Job.status.in_(['queued', 'running'])).distinct()}
+    for name in periodic_jobs:
+        if name not in active:
+            enqueue_periodic_job(name)
+    db.session.commit()
 
 
 # ===== MAIN ROUTES =====
 
-@app.route('/')
+@route('/')
 def home():
     return render_template('home.html')
 
 
-@app.route('/choose-role')
+@route('/choose-role')
 def choose_role():
     return render_template('choose_role.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        retry_after = login_throttled(email)
+        if retry_after:
+            return throttled_response('login.html', retry_after)
         user = User.query.filter_by(email=email).first()
         if not user:
             flash('No account found with this email address', 'error')
@@ -249,9 +1029,14 @@ def login():
         if not user.is_active:
             flash('Your account has been deactivated', 'error')
             return redirect(url_for('login'))
+        if user.rehash_password_if_needed(password):
+            db.session.commit()
+        current_app.extensions['rate_limiter'].reset('login_email', email.strip().lower())
+        regenerate_session()
         session['user_id'] = user.id
         session['user_role'] = user.role
         session.permanent = True
+        g.pop('current_user', None)
         flash(f'Welcome back, {user.first_name}!', 'success')
         if user.role == 'student':
             return redirect(url_for('student_dashboard'))
@@ -262,16 +1047,18 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
+    regenerate_session()
+    g.pop('current_user', None)
     flash('You have been logged out successfully', 'success')
     return redirect(url_for('home'))
 
 
 # ===== STUDENT REGISTRATION =====
 
-@app.route('/student/register', methods=['GET', 'POST'])
+@route('/student/register', methods=['GET', 'POST'])
 def student_registration():
     if request.method == 'POST':
         first_name = request.form.get('first_name')
@@ -297,6 +1084,7 @@ def student_registration():
         db.session.flush()
         student_profile = StudentProfile(user_id=user.id, grade=grade, board=board, subjects=','.join(subjects), city=city, address=address)
         db.session.add(student_profile)
+        bump_metric('students')
         db.session.commit()
         flash('Registration successful! Please login', 'success')
         return redirect(url_for('login'))
@@ -305,7 +1093,7 @@ def student_registration():
 
 # ===== TEACHER REGISTRATION =====
 
-@app.route('/teacher/register', methods=['GET', 'POST'])
+@route('/teacher/register', methods=['GET', 'POST'])
 def teacher_registration():
     if request.method == 'POST':
         first_name = request.form.get('first_name')
@@ -333,7 +1121,9 @@ def teacher_registration():
         db.session.add(user)
         db.session.flush()
         teacher_profile = TeacherProfile(user_id=user.id, qualification=qualification, experience=experience, subjects=','.join(subjects), teaching_mode=','.join(teaching_mode), hourly_rate=int(hourly_rate), bio=bio, city=city, address=address)
+        sync_teacher_search_terms(teacher_profile)
         db.session.add(teacher_profile)
+        bump_metric('teachers')
         db.session.commit()
         flash('Registration successful! Please login', 'success')
         return redirect(url_for('login'))
@@ -342,57 +1132,28 @@ def teacher_registration():
 
 # ===== STUDENT DASHBOARD =====
 
-@app.route('/student/dashboard')
-@login_required
+@route('/student/dashboard')
+@role_required('student')
 def student_dashboard():
     user = get_current_user()
-    if user.role != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    tutors = []
-    if user.student_profile:
-        tutors = User.query.join(TeacherProfile).filter(User.role == 'teacher', TeacherProfile.city == user.student_profile.city).limit(6).all()
-    classes = []
-    unread_messages = Message.query.filter_by(recipient_id=user.id, is_read=False).count()
-    admin_users = User.query.filter_by(role='admin').all()
-    admin_ids = [admin.id for admin in admin_users]
-    admin_messages = Message.query.filter(Message.recipient_id == user.id, Message.sender_id.in_(admin_ids)).order_by(Message.created_at.desc()).limit(10).all()
-    return render_template('student_dashboard.html', current_user=user, tutors=tutors, classes=classes, messages=range(unread_messages), admin_messages=admin_messages)
+    return render_template('student_dashboard.html', current_user=user, **student_dashboard_data(user))
 
 
 # ===== TEACHER DASHBOARD =====
 
-@app.route('/teacher/dashboard')
-@login_required
+@route('/teacher/dashboard')
+@role_required('teacher')
 def teacher_dashboard():
     user = get_current_user()
-    if user.role != 'teacher':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    pending_requests = TutorRequest.query.filter_by(teacher_id=user.id, status='pending').all()
-    accepted_request_ids = [req.id for req in TutorRequest.query.filter_by(teacher_id=user.id, status='accepted').all()]
-    students = []
-    if accepted_request_ids:
-        student_ids = [req.student_id for req in TutorRequest.query.filter(TutorRequest.id.in_(accepted_request_ids)).all()]
-        students = User.query.filter(User.id.in_(student_ids)).all()
-    classes = []
-    monthly_earnings = user.teacher_profile.total_earnings if user.teacher_profile else 0
-    unread_messages = Message.query.filter_by(recipient_id=user.id, is_read=False).count()
-    admin_users = User.query.filter_by(role='admin').all()
-    admin_ids = [admin.id for admin in admin_users]
-    admin_messages = Message.query.filter(Message.recipient_id == user.id, Message.sender_id.in_(admin_ids)).order_by(Message.created_at.desc()).limit(10).all()
-    return render_template('teacher_dashboard.html', current_user=user, pending_requests=pending_requests, students=students, classes=classes, monthly_earnings=monthly_earnings, messages=range(unread_messages), admin_messages=admin_messages)
+    return render_template('teacher_dashboard.html', current_user=user, **teacher_dashboard_data(user))
 
 
 # ===== PROFILE EDIT ROUTES =====
 
-@app.route('/student/edit-profile', methods=['GET', 'POST'])
-@login_required
+@route('/student/edit-profile', methods=['GET', 'POST'])
+@role_required('student')
 def student_edit_profile():
     user = get_current_user()
-    if user.role != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     if request.method == 'POST':
         user.first_name = request.form.get('first_name')
         user.last_name = request.form.get('last_name')
@@ -409,13 +1170,10 @@ def student_edit_profile():
     return render_template('student_edit_profile.html', current_user=user)
 
 
-@app.route('/teacher/edit-profile', methods=['GET', 'POST'])
-@login_required
+@route('/teacher/edit-profile', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_edit_profile():
     user = get_current_user()
-    if user.role != 'teacher':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     if request.method == 'POST':
         user.first_name = request.form.get('first_name')
         user.last_name = request.form.get('last_name')
@@ -429,6 +1187,7 @@ def teacher_edit_profile():
             user.teacher_profile.bio = request.form.get('bio')
             user.teacher_profile.city = request.form.get('city')
             user.teacher_profile.address = request.form.get('address')
+            sync_teacher_search_terms(user.teacher_profile)
         db.session.commit()
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('teacher_dashboard'))
@@ -437,29 +1196,21 @@ def teacher_edit_profile():
 
 # ===== FIND TUTORS =====
 
-@app.route('/find-tutors')
+@route('/find-tutors')
 @login_required
 def find_tutors():
     city = request.args.get('city', '')
     subject = request.args.get('subject', '')
     mode = request.args.get('mode', '')
-    max_price = request.args.get('max_price', '')
-    query = User.query.join(TeacherProfile).filter(User.role == 'teacher')
-    if city:
-        query = query.filter(TeacherProfile.city.ilike(f'%{city}%'))
-    if subject:
-        query = query.filter(TeacherProfile.subjects.ilike(f'%{subject}%'))
-    if mode:
-        query = query.filter(TeacherProfile.teaching_mode.ilike(f'%{mode}%'))
-    if max_price:
-        query = query.filter(TeacherProfile.hourly_rate <= int(max_price))
-    tutors = query.all()
-    return render_template('find_tutors.html', tutors=tutors)
+    max_price = request.args.get('max_price', type=int)
+    query = search_tutors(city=city, subject=subject, mode=mode, max_price=max_price)
+    tutors, next_cursor = paginate_tutors(query, after=request.args.get('after'))
+    return render_template('find_tutors.html', tutors=tutors, next_cursor=next_cursor)
 
 
 # ===== TUTOR REQUEST =====
 
-@app.route('/request-tutor/<int:teacher_id>')
+@route('/request-tutor/<int:teacher_id>')
 @login_required
 def request_tutor_page(teacher_id):
     teacher = User.query.get_or_404(teacher_id)
@@ -469,8 +1220,8 @@ def request_tutor_page(teacher_id):
     return render_template('request_tutor.html', teacher=teacher, current_user=get_current_user())
 
 
-@app.route('/send-tutor-request', methods=['POST'])
-@login_required
+@route('/send-tutor-request', methods=['POST'])
+@role_required('student')
 def send_tutor_request():
     teacher_id = request.form.get('teacher_id')
     subject = request.form.get('subject')
@@ -489,189 +1240,331 @@ def send_tutor_request():
     return redirect(url_for('student_dashboard'))
 
 
-@app.route('/handle-request', methods=['POST'])
-@login_required
+@route('/handle-request', methods=['POST'])
+@role_required('teacher')
 def handle_request():
     request_id = request.form.get('request_id')
     action = request.form.get('action')
     tutor_request = TutorRequest.query.get(request_id)
-    if not tutor_request:
+    if not tutor_request or tutor_request.teacher_id != get_current_user().id:
         flash('Request not found', 'error')
         return redirect(url_for('teacher_dashboard'))
+    was_accepted = tutor_request.status == 'accepted'
     if action == 'accept':
         tutor_request.status = 'accepted'
         flash('Request accepted!', 'success')
     elif action == 'reject':
         tutor_request.status = 'rejected'
         flash('Request declined', 'success')
+    is_accepted = tutor_request.status == 'accepted'
+    if is_accepted != was_accepted:
+        bump_metric('connections', 1 if is_accepted else -1)
     db.session.commit()
     return redirect(url_for('teacher_dashboard'))
 
 
 # ===== CHAT ROUTES =====
 
-@app.route('/chat')
-@app.route('/chat/<int:partner_id>')
+@route('/chat')
+@route('/chat/<int:partner_id>')
 @login_required
 def chat(partner_id=None):
     user = get_current_user()
-    if user.role == 'student':
-        accepted_requests = TutorRequest.query.filter_by(student_id=user.id, status='accepted').all()
-        conversation_partners = [req.teacher for req in accepted_requests]
-    else:
-        accepted_requests = TutorRequest.query.filter_by(teacher_id=user.id, status='accepted').all()
-        conversation_partners = [req.student for req in accepted_requests]
-    conversations = []
-    seen_partners = set()
-    for partner in conversation_partners:
-        if partner.id in seen_partners:
-            continue
-        seen_partners.add(partner.id)
-        last_msg = Message.query.filter(((Message.sender_id == user.id) & (Message.recipient_id == partner.id)) | ((Message.sender_id == partner.id) & (Message.recipient_id == user.id))).order_by(Message.created_at.desc()).first()
-        unread_count = Message.query.filter_by(sender_id=partner.id, recipient_id=user.id, is_read=False).count()
-        conversations.append({'partner': partner, 'last_message': last_msg.message if last_msg else 'No messages yet', 'last_message_time': last_msg.created_at if last_msg else None, 'unread_count': unread_count, 'id': partner.id})
     partner = None
     messages = []
+    older_cursor = None
+    poll_after = 0
     if partner_id:
         partner = User.query.get(partner_id)
         if partner:
-            messages = Message.query.filter(((Message.sender_id == user.id) & (Message.recipient_id == partner_id)) | ((Message.sender_id == partner_id) & (Message.recipient_id == user.id))).order_by(Message.created_at.asc()).all()
-            Message.query.filter_by(sender_id=partner_id, recipient_id=user.id, is_read=False).update({'is_read': True})
+            # Commit before loading the page: a commit expires every loaded
+            # object, and the template would then refresh each message one by one
+            mark_conversation_read(user.id, partner_id)
             db.session.commit()
-    return render_template('chat.html', current_user=user, conversations=conversations, partner=partner, messages=messages, active_conversation_id=partner_id)
+            # Read before the thread, so a message committed in between is
+            # polled again (and de-duplicated by the page) rather than missed
+            poll_after = latest_message_id(user.id)
+            messages, older_cursor = get_thread_page(user.id, partner_id)
+    conversations = get_conversations(user)
+    return render_template('chat.html', current_user=user, conversations=conversations, partner=partner, messages=messages, older_cursor=older_cursor, poll_after=poll_after, active_conversation_id=partner_id)
+
+
+@route('/chat/<int:partner_id>/older')
+@login_required
+def chat_older_messages(partner_id):
+    user = get_current_user()
+    before = decode_message_cursor(request.args.get('before', ''))
+    if not before:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    messages, older_cursor = get_thread_page(user.id, partner_id, before=before)
+    return jsonify({'messages': [msg.to_dict() for msg in messages], 'older_cursor': older_cursor})
 
 
-@app.route('/send-message', methods=['POST'])
+@route('/send-message', methods=['POST'])
 @login_required
 def send_message():
-    recipient_id = request.form.get('recipient_id')
+    recipient_id = request.form.get('recipient_id', type=int)
     message_text = request.form.get('message')
     user = get_current_user()
     if not message_text or not recipient_id:
         flash('Message cannot be empty', 'error')
         return redirect(url_for('chat'))
-    message = Message(sender_id=user.id, recipient_id=recipient_id, message=message_text, is_read=False)
-    db.session.add(message)
+    if not db.session.get(User, recipient_id):
+        flash('Recipient not found', 'error')
+        return redirect(url_for('chat'))
+    payload = record_message(user.id, recipient_id, message_text).to_dict()
     db.session.commit()
+    publish_message(payload)
     return redirect(url_for('chat', partner_id=recipient_id))
 
 
+@route('/api/messages', methods=['POST'])
+@login_required
+def api_send_message():
+    data = request.get_json(silent=True) or {}
+    message_text = (data.get('message') or '').strip()
+    try:
+        recipient_id = int(data.get('recipient_id'))
+    except (TypeError, ValueError):
+        recipient_id = None
+    if not message_text or not recipient_id:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    if not db.session.get(User, recipient_id):
+        return jsonify({'error': 'Recipient not found'}), 404
+    user = get_current_user()
+    payload = record_message(user.id, recipient_id, message_text).to_dict()
+    db.session.commit()
+    publish_message(payload)
+    return jsonify(payload), 201
+
+
+@route('/chat/poll')
+@login_required
+def chat_poll():
+    """Messages to or from the user after ?after=<message id>, long-polled.
+
+    Waits up to CHAT_POLL_TIMEOUT seconds for a new message, but only while
+    fewer than CHAT_POLL_MAX_WAITERS polls already wait in this process;
+    otherwise it answers at once and the client retries after retry_ms. A
+    first poll without ?after returns the cursor to start from; the chat
+    page renders its own so nothing sent before the first poll is lost. It
+    passes ?partner=<user id> for its open thread, whose new messages
+    are then marked read as they are delivered.
+    """
+    user_id = session['user_id']
+    after = request.args.get('after', type=int)
+    partner_id = request.args.get('partner', type=int)
+    if after is None:
+        return jsonify({'messages': [], 'after': latest_message_id(user_id), 'retry_ms': 0})
+    waiters = current_app.extensions['chat_poll_waiters']
+    retry_ms = 0
+    # Subscribe before querying so a message committed in between still wakes us
+    with current_app.extensions['chat_broker'].subscribe(f'user:{user_id}') as subscription:
+        messages = get_new_messages(user_id, after)
+        if not messages:
+            if waiters.acquire(blocking=False):
+                # Don't hold a pooled connection while waiting
+                db.session.remove()
+                try:
+                    subscription.get(timeout=current_app.config['CHAT_POLL_TIMEOUT'])
+                finally:
+                    waiters.release()
+                # Look again even if nothing woke us: another worker's broker
+                # never publishes here, but its message is in the database
+                messages = get_new_messages(user_id, after)
+            else:
+                retry_ms = current_app.config['CHAT_POLL_INTERVAL'] * 1000
+    if partner_id and any(msg['sender_id'] == partner_id for msg in messages):
+        mark_conversation_read(user_id, partner_id)
+        db.session.commit()
+    return jsonify({'messages': messages, 'after': max([after] + [msg['id'] for msg in messages]), 'retry_ms': retry_ms})
+
+
 # ===== TERMS AND CONDITIONS =====
 
-@app.route('/terms-and-conditions')
+@route('/terms-and-conditions')
 def terms_and_conditions():
     return render_template('terms_and_conditions.html')
 
 
-@app.route('/terms-student')
+@route('/terms-student')
 def terms_student():
     return render_template('terms_student.html')
 
 
-@app.route('/terms-teacher')
+@route('/terms-teacher')
 def terms_teacher():
     return render_template('terms_teacher.html')
 
 
 # ===== PAYMENT SYSTEM ROUTES =====
 
-@app.route('/teacher/log-class', methods=['GET', 'POST'])
-@login_required
+@route('/teacher/log-class', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_log_class():
     user = get_current_user()
-    if user.role != 'teacher':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    accepted_requests = TutorRequest.query.filter_by(teacher_id=user.id, status='accepted').all()
     if request.method == 'POST':
-        student_id = request.form.get('student_id')
-        request_id = request.form.get('request_id')
+        student_id = request.form.get('student_id', type=int)
+        request_id = request.form.get('request_id', type=int)
         duration = float(request.form.get('duration', 1))
         notes = request.form.get('notes', '')
-        class_date = request.form.get('class_date')
-        hourly_rate = user.teacher_profile.hourly_rate
-        amount = int(duration * hourly_rate)
-        session_record = ClassSession(student_id=student_id, teacher_id=user.id, request_id=request_id, date=datetime.strptime(class_date, '%Y-%m-%d').date(), duration_hours=duration, hourly_rate=hourly_rate, amount=amount, notes=notes)
-        db.session.add(session_record)
-        cycle = PaymentCycle.query.filter_by(student_id=student_id, teacher_id=user.id, status='active').first()
-        if not cycle:
-            cycle = PaymentCycle(student_id=student_id, teacher_id=user.id, start_date=datetime.utcnow().date())
-            db.session.add(cycle)
-        cycle.total_classes += 1
-        cycle.total_amount += amount
-        cycle.commission = int(cycle.total_amount * 0.10)
-        cycle.teacher_earning = cycle.total_amount - cycle.commission
-        if cycle.total_classes >= 25:
-            cycle.status = 'pending_payment'
-            cycle.end_date = datetime.utcnow().date()
+        class_date = datetime.strptime(request.form.get('class_date'), '%Y-%m-%d').date()
+        session_record, created = log_class_session(user, student_id, request_id, class_date, duration, notes, idempotency_key=request.form.get('idempotency_key'))
         db.session.commit()
-        flash(f'Class logged! ₹{amount} added to billing.', 'success')
+        if created:
+            flash(f'Class logged! ₹{session_record.amount} added to billing.', 'success')
+        else:
+            flash('This class was already logged.', 'info')
         return redirect(url_for('teacher_log_class'))
+    accepted_requests = TutorRequest.query.options(db.joinedload(TutorRequest.student)).filter_by(teacher_id=user.id, status='accepted').all()
     today = datetime.utcnow().strftime('%Y-%m-%d')
-    return render_template('teacher_log_class.html', current_user=user, accepted_requests=accepted_requests, today=today)
+    recent_sessions = ClassSession.query.options(db.joinedload(ClassSession.student)).filter_by(teacher_id=user.id).order_by(ClassSession.id.desc()).limit(10).all()
+    session_count, session_total = db.session.query(db.func.count(ClassSession.id), db.func.coalesce(db.func.sum(ClassSession.amount), 0)).filter(ClassSession.teacher_id == user.id).one()
+    return render_template('teacher_log_class.html', current_user=user, accepted_requests=accepted_requests, today=today, idempotency_key=uuid.uuid4().hex, recent_sessions=recent_sessions, session_count=session_count, session_total=session_total)
 
 
-@app.route('/teacher/my-earnings')
-@login_required
-def teacher_earnings():
+@route('/teacher/log-classes', methods=['POST'])
+@role_required('teacher')
+def teacher_log_classes():
+    """Bulk-log class sessions from a JSON body or an uploaded CSV file.
+
+    JSON: a list of {student_id, date, duration, notes, idempotency_key}
+    objects, or {"sessions": [...]}. CSV: a header row with the same
+    column names. All rows are validated first; nothing is saved unless
+    every row is valid.
+    """
     user = get_current_user()
-    if user.role != 'teacher':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    cycles = PaymentCycle.query.filter_by(teacher_id=user.id).order_by(PaymentCycle.created_at.desc()).all()
-    total_earned = sum(c.teacher_earning for c in cycles if c.status == 'paid')
-    pending_amount = sum(c.teacher_earning for c in cycles if c.status in ['pending_payment', 'pending_verification'])
-    return render_template('teacher_earnings.html', current_user=user, cycles=cycles, total_earned=total_earned, pending_amount=pending_amount)
+    unreadable = False
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        rows = payload.get('sessions') if isinstance(payload, dict) else payload
+    elif request.files.get('file'):
+        try:
+            rows = list(csv.DictReader(io.TextIOWrapper(request.files['file'].stream, encoding='utf-8-sig')))
+        except (UnicodeDecodeError, csv.Error):
+            rows, unreadable = None, True
+    else:
+        rows = None
+    status = 400
+    if unreadable:
+        errors = ['The file must be a UTF-8 CSV']
+    elif not isinstance(rows, list) or not rows:
+        errors = ['Send a JSON list of sessions or upload a CSV file']
+    elif len(rows) > current_app.config['BULK_LOG_MAX_SESSIONS']:
+        errors = [f"At most {current_app.config['BULK_LOG_MAX_SESSIONS']} sessions can be logged at once"]
+    else:
+        request_ids = dict(db.session.query(TutorRequest.student_id, db.func.min(TutorRequest.id)).filter_by(teacher_id=user.id, status='accepted').group_by(TutorRequest.student_id))
+        entries, errors = parse_class_entries(rows, request_ids)
+    if not errors:
+        try:
+            logged, skipped = log_class_sessions(user, entries)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            errors = ['Some of these sessions were logged by another request; please retry']
+            status = 409
+    if request.is_json:
+        if errors:
+            return jsonify({'errors': errors}), status
+        return jsonify({'logged': logged, 'skipped': skipped})
+    if errors:
+        for error in errors[:10]:
+            flash(error, 'error')
+    else:
+        flash(f'{logged} classes logged' + (f', {skipped} already logged' if skipped else '') + '.', 'success')
+    return redirect(url_for('teacher_log_class'))
 
 
-@app.route('/student/my-classes')
-@login_required
+@route('/teacher/my-earnings')
+@role_required('teacher')
+def teacher_earnings():
+    user = get_current_user()
+    pagination = (PaymentCycle.query.options(db.joinedload(PaymentCycle.student))
+                  .filter_by(teacher_id=user.id)
+                  .order_by(PaymentCycle.created_at.desc(), PaymentCycle.id.desc())
+                  .paginate(page=request.args.get('page', 1, type=int), per_page=current_app.config['ITEMS_PER_PAGE'], error_out=False))
+    # Paid history comes from the monthly rollup; only the few open cycles are summed live
+    total_earned = db.session.query(db.func.coalesce(db.func.sum(EarningsRollup.teacher_earning), 0)).filter(EarningsRollup.teacher_id == user.id).scalar()
+    totals = cycle_totals(PaymentCycle.teacher_id == user.id, PaymentCycle.status.in_(PENDING_PAYMENT_STATUSES))
+    pending_amount = sum(t['teacher_earning'] for t in totals.values())
+    monthly_earnings = EarningsRollup.query.filter_by(teacher_id=user.id).order_by(EarningsRollup.month.desc()).limit(12).all()
+    return render_template('teacher_earnings.html', current_user=user, cycles=pagination.items, pagination=pagination, total_earned=total_earned, pending_amount=pending_amount, monthly_earnings=monthly_earnings)
+
+
+@route('/student/my-classes')
+@role_required('student')
 def student_classes():
     user = get_current_user()
-    if user.role != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     sessions = ClassSession.query.filter_by(student_id=user.id).order_by(ClassSession.date.desc()).all()
     active_cycles = PaymentCycle.query.filter_by(student_id=user.id, status='active').all()
     pending_payments = PaymentCycle.query.filter(PaymentCycle.student_id == user.id, PaymentCycle.status.in_(['pending_payment', 'pending_verification'])).all()
     return render_template('student_classes.html', current_user=user, sessions=sessions, active_cycles=active_cycles, pending_payments=pending_payments)
 
 
-@app.route('/student/pay/<int:cycle_id>', methods=['GET', 'POST'])
-@login_required
+def process_payment_screenshot(app, cycle_id):
+    """Recompress a cycle's uploaded screenshot and thumbnail it, on the upload pool.
+
+    Runs in the web process that saved the upload, since the file is only on
+    its disk. If it fails the original is kept and shown without a thumbnail.
+    """
+    with app.app_context():
+        try:
+            cycle = db.session.get(PaymentCycle, cycle_id)
+            if not cycle or not cycle.payment_screenshot:
+                return
+            original = cycle.payment_screenshot
+            image_path, thumbnail_path = process_image(original, os.path.join(app.config['PAYMENT_UPLOAD_FOLDER'], 'thumbs'),
+                                                       max_dimension=app.config['PAYMENT_IMAGE_MAX_DIMENSION'],
+                                                       thumbnail_size=app.config['PAYMENT_THUMBNAIL_SIZE'])
+            # Other cycles may point at the same content-addressed upload
+            PaymentCycle.query.filter_by(payment_screenshot=original).update({'payment_screenshot': image_path, 'payment_thumbnail': thumbnail_path}, synchronize_session=False)
+            db.session.commit()
+            if image_path != original and os.path.exists(original):
+                os.remove(original)
+        except Exception:
+            app.logger.exception('Processing the payment screenshot of cycle %s failed', cycle_id)
+
+
+@route('/student/pay/<int:cycle_id>', methods=['GET', 'POST'])
+@role_required('student')
 def student_pay(cycle_id):
     user = get_current_user()
-    if user.role != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     cycle = PaymentCycle.query.get_or_404(cycle_id)
     if cycle.student_id != user.id:
         flash('Access denied', 'error')
         return redirect(url_for('student_dashboard'))
     if request.method == 'POST':
-        if 'screenshot' in request.files:
-            file = request.files['screenshot']
-            if file.filename:
-                payments_dir = os.path.join('static', 'payments')
-                os.makedirs(payments_dir, exist_ok=True)
-                filename = f"payment_{cycle_id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.png"
-                filepath = os.path.join(payments_dir, filename)
-                file.save(filepath)
-                cycle.payment_screenshot = filepath
-                cycle.status = 'pending_verification'
-                db.session.commit()
-                flash('Payment screenshot uploaded! We will verify and confirm soon.', 'success')
-                return redirect(url_for('student_classes'))
+        try:
+            file = request.files.get('screenshot')
+        except RequestEntityTooLarge:
+            flash(f"Images must be smaller than {current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB.", 'error')
+            return redirect(url_for('student_pay', cycle_id=cycle_id))
+        if file and file.filename:
+            try:
+                filepath = save_image_upload(file.stream, current_app.config['PAYMENT_UPLOAD_FOLDER'], current_app.config['MAX_CONTENT_LENGTH'])
+            except UploadError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('student_pay', cycle_id=cycle_id))
+            cycle.payment_screenshot = filepath
+            cycle.payment_thumbnail = None
+            cycle.status = 'pending_verification'
+            db.session.commit()
+            current_app.extensions['upload_pool'].submit(process_payment_screenshot, current_app._get_current_object(), cycle.id)
+            flash('Payment screenshot uploaded! We will verify and confirm soon.', 'success')
+            return redirect(url_for('student_classes'))
     return render_template('student_pay.html', current_user=user, cycle=cycle, upi_id='9012977681@ybl')
 
 
 # ===== ADMIN ROUTES =====
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        retry_after = login_throttled(email)
+        if retry_after:
+            return throttled_response('admin_login.html', retry_after)
         user = User.query.filter_by(email=email, role='admin').first()
         if not user:
             flash('Invalid admin credentials', 'error')
@@ -679,72 +1572,55 @@ def admin_login():
         if not user.check_password(password):
             flash('Incorrect password', 'error')
             return redirect(url_for('admin_login'))
+        if user.rehash_password_if_needed(password):
+            db.session.commit()
+        current_app.extensions['rate_limiter'].reset('login_email', email.strip().lower())
+        regenerate_session()
         session['user_id'] = user.id
         session['user_role'] = user.role
         session.permanent = True
+        g.pop('current_user', None)
         flash('Welcome Admin!', 'success')
         return redirect(url_for('admin_dashboard'))
     return render_template('admin_login.html')
 
 
-@app.route('/admin/dashboard')
-@login_required
+@route('/admin/dashboard')
+@role_required('admin')
 def admin_dashboard():
     user = get_current_user()
-    if user.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    total_students = User.query.filter_by(role='student').count()
-    total_teachers = User.query.filter_by(role='teacher').count()
-    total_connections = TutorRequest.query.filter_by(status='accepted').count()
-    total_messages = Message.query.count()
+    metrics = get_metrics()
+    total_students = metrics['students']
+    total_teachers = metrics['teachers']
+    total_connections = metrics['connections']
+    total_messages = metrics['messages']
     recent_students = User.query.filter_by(role='student').order_by(User.created_at.desc()).limit(5).all()
     recent_teachers = User.query.filter_by(role='teacher').order_by(User.created_at.desc()).limit(5).all()
     return render_template('admin_dashboard.html', current_user=user, total_students=total_students, total_teachers=total_teachers, total_connections=total_connections, total_messages=total_messages, recent_students=recent_students, recent_teachers=recent_teachers)
 
 
-@app.route('/admin/students')
-@login_required
+@route('/admin/students')
+@role_required('admin')
 def admin_students():
     user = get_current_user()
-    if user.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    students = User.query.filter_by(role='student').all()
-    student_data = []
-    for student in students:
-        accepted_requests = TutorRequest.query.filter_by(student_id=student.id, status='accepted').all()
-        teachers = [req.teacher for req in accepted_requests]
-        total_classes = len(accepted_requests)
-        student_data.append({'student': student, 'teachers': teachers, 'total_classes': total_classes})
-    return render_template('admin_students.html', current_user=user, student_data=student_data)
-
-
-@app.route('/admin/teachers')
-@login_required
+    filters = {key: request.args.get(key, '') for key in ('name', 'email', 'city')}
+    student_data, pagination = admin_student_listing(page=request.args.get('page', 1, type=int), **filters)
+    return render_template('admin_students.html', current_user=user, student_data=student_data, pagination=pagination, filters=filters)
+
+
+@route('/admin/teachers')
+@role_required('admin')
 def admin_teachers():
     user = get_current_user()
-    if user.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    teachers = User.query.filter_by(role='teacher').all()
-    teacher_data = []
-    for teacher in teachers:
-        accepted_requests = TutorRequest.query.filter_by(teacher_id=teacher.id, status='accepted').all()
-        students = [req.student for req in accepted_requests]
-        total_earnings = teacher.teacher_profile.total_earnings if teacher.teacher_profile else 0
-        commission = int(total_earnings * 0.10)
-        teacher_data.append({'teacher': teacher, 'students': students, 'total_students': len(students), 'total_earnings': total_earnings, 'commission': commission})
-    return render_template('admin_teachers.html', current_user=user, teacher_data=teacher_data)
-
-
-@app.route('/admin/user/<int:user_id>')
-@login_required
+    filters = {key: request.args.get(key, '') for key in ('name', 'email', 'city')}
+    teacher_data, pagination = admin_teacher_listing(page=request.args.get('page', 1, type=int), **filters)
+    return render_template('admin_teachers.html', current_user=user, teacher_data=teacher_data, pagination=pagination, filters=filters)
+
+
+@route('/admin/user/<int:user_id>')
+@role_required('admin')
 def admin_user_detail(user_id):
     admin = get_current_user()
-    if admin.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     user = User.query.get_or_404(user_id)
     if user.role == 'student':
         connections = TutorRequest.query.filter_by(student_id=user.id, status='accepted').all()
@@ -756,95 +1632,187 @@ def admin_user_detail(user_id):
     return render_template('admin_user_detail.html', current_user=admin, user=user, connected_users=connected_users, messages=messages)
 
 
-@app.route('/admin/send-message/<int:user_id>', methods=['POST'])
-@login_required
+@route('/admin/send-message/<int:user_id>', methods=['POST'])
+@role_required('admin')
 def admin_send_message(user_id):
     admin = get_current_user()
-    if admin.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     message_text = request.form.get('message')
     if message_text:
-        message = Message(sender_id=admin.id, recipient_id=user_id, message=message_text, is_read=False)
-        db.session.add(message)
+        payload = record_message(admin.id, user_id, message_text).to_dict()
         db.session.commit()
+        publish_message(payload)
         flash('Message sent!', 'success')
     return redirect(url_for('admin_user_detail', user_id=user_id))
 
 
-@app.route('/admin/payments')
-@login_required
+@route('/admin/payments')
+@role_required('admin')
 def admin_payments():
     user = get_current_user()
-    if user.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
-    pending = PaymentCycle.query.filter_by(status='pending_verification').all()
-    completed = PaymentCycle.query.filter_by(status='paid').order_by(PaymentCycle.payment_verified_at.desc()).limit(20).all()
-    total_commission = sum(c.commission for c in PaymentCycle.query.filter_by(status='paid').all())
+    people = (db.joinedload(PaymentCycle.student), db.joinedload(PaymentCycle.teacher).joinedload(User.teacher_profile))
+    pending = PaymentCycle.query.options(*people).filter_by(status='pending_verification').all()
+    completed = PaymentCycle.query.options(*people).filter_by(status='paid').order_by(PaymentCycle.payment_verified_at.desc()).limit(20).all()
+    total_commission = db.session.query(db.func.coalesce(db.func.sum(EarningsRollup.commission), 0)).scalar()
     return render_template('admin_payments.html', current_user=user, pending=pending, completed=completed, total_commission=total_commission)
 
 
-@app.route('/admin/verify-payment/<int:cycle_id>', methods=['POST'])
-@login_required
+@route('/admin/verify-payment/<int:cycle_id>', methods=['POST'])
+@role_required('admin')
 def admin_verify_payment(cycle_id):
-    user = get_current_user()
-    if user.role != 'admin':
-        flash('Access denied', 'error')
-        return redirect(url_for('home'))
     cycle = PaymentCycle.query.get_or_404(cycle_id)
     action = request.form.get('action')
+    if action not in ('approve', 'reject'):
+        return redirect(url_for('admin_payments'))
+    previously_verified_at = cycle.payment_verified_at
+    if action == 'approve':
+        changes = {'status': 'paid', 'payment_verified_at': datetime.utcnow()}
+    else:
+        changes = {'status': 'pending_payment', 'payment_screenshot': None, 'payment_thumbnail': None, 'payment_verified_at': None}
+    # Only a cycle still awaiting verification moves on, so a double submit can't pay a teacher twice
+    if not PaymentCycle.query.filter_by(id=cycle.id, status='pending_verification').update(changes, synchronize_session=False):
+        flash('This payment has already been handled.', 'info')
+        return redirect(url_for('admin_payments'))
+    db.session.expire(cycle)
     if action == 'approve':
-        cycle.status = 'paid'
-        cycle.payment_verified_at = datetime.utcnow()
-        if cycle.teacher.teacher_profile:
-            cycle.teacher.teacher_profile.total_earnings += cycle.teacher_earning
-        new_cycle = PaymentCycle(student_id=cycle.student_id, teacher_id=cycle.teacher_id, start_date=datetime.utcnow().date())
-        db.session.add(new_cycle)
+        TeacherProfile.query.filter_by(user_id=cycle.teacher_id).update({'total_earnings': db.func.coalesce(TeacherProfile.total_earnings, 0) + cycle.teacher_earning}, synchronize_session=False)
+        get_active_cycle(cycle.student_id, cycle.teacher_id)
         flash(f'Payment verified! Teacher will receive ₹{cycle.teacher_earning}', 'success')
-    elif action == 'reject':
-        cycle.status = 'pending_payment'
-        cycle.payment_screenshot = None
+    else:
         flash('Payment rejected. Student will need to re-upload screenshot.', 'error')
+    # Refresh the month the cycle is now counted in and any month it was counted in before
+    months = {month_start(moment): moment for moment in (previously_verified_at, cycle.payment_verified_at) if moment}
+    for moment in months.values():
+        refresh_earnings_rollup(cycle.teacher_id, moment)
     db.session.commit()
     return redirect(url_for('admin_payments'))
 
 
 # ===== EXPORT ROUTES =====
 
-@app.route('/admin/export-students')
-def export_students():
-    students = User.query.filter_by(role='student').all()
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Name', 'Email', 'Phone', 'Grade', 'Board', 'City', 'Subjects', 'Registered'])
-    for student in students:
-        if student.student_profile:
-            writer.writerow([f"{student.first_name} {student.last_name}", student.email, student.phone, student.student_profile.grade, student.student_profile.board, student.student_profile.city, student.student_profile.subjects, student.created_at.strftime('%Y-%m-%d %H:%M')])
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=vaanyan_students.csv"
-    output.headers["Content-type"] = "text/csv"
+class _CSVLine:
+    """File-like target that hands back whatever csv.writer writes."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows, rows_per_chunk=500):
+    writer = csv.writer(_CSVLine())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= rows_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_download(header, rows, filename):
+    """Stream CSV rows to the client, gzip-compressed when ?gzip=1."""
+    body = iter_csv(header, rows)
+    if request.args.get('gzip', type=int):
+        body = iter_gzip(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv'
+    output = Response(stream_with_context(body), mimetype=mimetype)
+    output.headers["Content-Disposition"] = f"attachment; filename={filename}"
     return output
 
 
-@app.route('/admin/export-teachers')
+@route('/admin/export-students')
+@role_required('admin')
+def export_students():
+    students = db.session.query(User.first_name, User.last_name, User.email, User.phone, StudentProfile.grade, StudentProfile.board, StudentProfile.city, StudentProfile.subjects, User.created_at) \
+        .join(StudentProfile, StudentProfile.user_id == User.id) \
+        .filter(User.role == 'student') \
+        .order_by(User.id) \
+        .yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+    rows = ([f"{first_name} {last_name}", email, phone, grade, board, city, subjects, created_at.strftime('%Y-%m-%d %H:%M')] for first_name, last_name, email, phone, grade, board, city, subjects, created_at in students)
+    return csv_download(['Name', 'Email', 'Phone', 'Grade', 'Board', 'City', 'Subjects', 'Registered'], rows, 'vaanyan_students.csv')
+
+
+@route('/admin/export-teachers')
+@role_required('admin')
 def export_teachers():
-    teachers = User.query.filter_by(role='teacher').all()
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Name', 'Email', 'Phone', 'Qualification', 'Experience', 'City', 'Subjects', 'Rate', 'Registered'])
-    for teacher in teachers:
-        if teacher.teacher_profile:
-            writer.writerow([f"{teacher.first_name} {teacher.last_name}", teacher.email, teacher.phone, teacher.teacher_profile.qualification, teacher.teacher_profile.experience, teacher.teacher_profile.city, teacher.teacher_profile.subjects, teacher.teacher_profile.hourly_rate, teacher.created_at.strftime('%Y-%m-%d %H:%M')])
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=vaanyan_teachers.csv"
-    output.headers["Content-type"] = "text/csv"
+    teachers = db.session.query(User.first_name, User.last_name, User.email, User.phone, TeacherProfile.qualification, TeacherProfile.experience, TeacherProfile.city, TeacherProfile.subjects, TeacherProfile.hourly_rate, User.created_at) \
+        .join(TeacherProfile, TeacherProfile.user_id == User.id) \
+        .filter(User.role == 'teacher') \
+        .order_by(User.id) \
+        .yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+    rows = ([f"{first_name} {last_name}", email, phone, qualification, experience, city, subjects, hourly_rate, created_at.strftime('%Y-%m-%d %H:%M')] for first_name, last_name, email, phone, qualification, experience, city, subjects, hourly_rate, created_at in teachers)
+    return csv_download(['Name', 'Email', 'Phone', 'Qualification', 'Experience', 'City', 'Subjects', 'Rate', 'Registered'], rows, 'vaanyan_teachers.csv')
+
+
+# Bulk exports for analytics: every entity is exported in id order up to a
+# watermark that the next incremental (since_id) run resumes from.
+EXPORT_ENTITIES = {
+    'users': (User, ['id', 'role', 'first_name', 'last_name', 'email', 'phone', 'is_active', 'created_at']),
+    'requests': (TutorRequest, ['id', 'student_id', 'teacher_id', 'subject', 'message', 'status', 'created_at']),
+    'class_sessions': (ClassSession, ['id', 'student_id', 'teacher_id', 'request_id', 'date', 'duration_hours', 'hourly_rate', 'amount', 'status', 'notes', 'created_at']),
+    'payment_cycles': (PaymentCycle, ['id', 'student_id', 'teacher_id', 'start_date', 'end_date', 'total_classes', 'total_amount', 'commission', 'teacher_earning', 'status', 'payment_verified_at', 'created_at']),
+    'messages': (Message, ['id', 'sender_id', 'recipient_id', 'message', 'is_read', 'created_at']),
+}
+
+
+def export_rows(entity, since_id=None, since=None):
+    """Columns, a batched row iterator and the watermark for one export.
+
+    The watermark is the newest id created more than EXPORT_WATERMARK_LAG
+    seconds ago. Ids are handed out before commit, so a higher id can be
+    visible while a lower one is still in flight; stopping short of the
+    recent rows leaves them for the next run instead of skipping them for
+    good. The bound is fixed before streaming, so rows inserted mid-export
+    wait for the next run too.
+    """
+    model, columns = EXPORT_ENTITIES[entity]
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['EXPORT_WATERMARK_LAG'])
+    settled = db.session.query(model.id).filter(model.created_at < cutoff).order_by(model.id.desc()).limit(1).scalar()
+    watermark = max(settled or 0, since_id or 0)
+    query = db.session.query(*[getattr(model, column) for column in columns]).filter(model.id <= watermark)
+    if since_id:
+        query = query.filter(model.id > since_id)
+    if since:
+        query = query.filter(model.created_at > since)
+    rows = (tuple(row) for row in query.order_by(model.id).yield_per(current_app.config['EXPORT_BATCH_SIZE']))
+    return columns, rows, watermark
+
+
+@route('/admin/export/<entity>')
+@role_required('admin')
+def export_entity(entity):
+    export_format = request.args.get('format', 'jsonl')
+    if entity not in EXPORT_ENTITIES or export_format not in exports.FORMATS:
+        return jsonify({'error': 'Unknown entity or format'}), 404
+    since = request.args.get('since')
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO date or datetime'}), 400
+    columns, rows, watermark = export_rows(entity, since_id=request.args.get('since_id', type=int), since=since)
+    body = exports.iter_rows(export_format, columns, rows)
+    filename = f"vaanyan_{entity}.{'jsonl' if export_format == 'jsonl' else 'columnar.json'}"
+    if request.args.get('gzip', type=int):
+        body = iter_gzip(body)
+        filename += '.gz'
+    output = Response(stream_with_context(body), mimetype='application/gzip' if filename.endswith('.gz') else 'application/x-ndjson')
+    output.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    output.headers["X-Export-Watermark"] = str(watermark)
     return output
 
 
 # ===== CONTEXT PROCESSOR =====
 
-@app.context_processor
 def inject_user():
     return dict(current_user=get_current_user())
 
@@ -860,11 +1828,298 @@ def create_sample_data():
     db.session.commit()
 
 
-# ===== RUN APP =====
-
-with app.app_context():
-    db.create_all()
+# Arbitrary key for pg_advisory_xact_lock, so concurrent upgrades run one after another
+SCHEMA_UPGRADE_LOCK = 7211
+
+
+def upgrade_database():
+    """Bring an existing database up to the current models.
+
+    db.create_all() only creates missing tables, so this also adds columns
+    and indexes declared on the models since a table was first created.
+    Safe to run repeatedly. Run it from the release step (flask init-db)
+    rather than in workers; on PostgreSQL concurrent runs are serialized
+    by an advisory lock and the whole upgrade is one transaction.
+    """
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_UPGRADE_LOCK})
+        db.metadata.create_all(connection)
+        inspector = db.inspect(connection)
+        ddl_compiler = connection.dialect.ddl_compiler(connection.dialect, None)
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    if not column.nullable and column.server_default is None:
+                        # Existing rows need a value; the model must declare one the database can fill in
+                        raise RuntimeError(f'{table.name}.{column.name} is NOT NULL and needs a server_default to be added')
+                    column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+                elif existing_columns[column.name]['nullable'] and not column.nullable and column.server_default is not None:
+                    # A column made NOT NULL since: backfill its NULLs from the server_default first
+                    default = ddl_compiler.get_column_default_string(column)
+                    connection.execute(db.text(f'UPDATE {table.name} SET {column.name} = {default} WHERE {column.name} IS NULL'))
+                    if connection.dialect.name == 'postgresql':
+                        # SQLite can't alter a column; there the model's default keeps new rows filled in
+                        connection.execute(db.text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} SET DEFAULT {default}, '
+                                                   f'ALTER COLUMN {column.name} SET NOT NULL'))
+        # With every column in place, fix up rows that would break a new unique index
+        merge_duplicate_active_cycles(connection)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def initialize_database():
+    """Upgrade the schema, seed the admin account and backfill the derived tables.
+
+    Run once per deploy (the Procfile release step), not in every worker.
+    """
+    upgrade_database()
     create_sample_data()
+    if TeacherProfile.query.first() and not TeacherSubject.query.first():
+        rebuild_search_index()
+    if Message.query.first() and not Conversation.query.first():
+        rebuild_conversations()
+    if not MetricCounter.query.first():
+        reconcile_metrics()
+    if not EarningsRollup.query.first() and PaymentCycle.query.filter_by(status='paid').first():
+        rebuild_earnings_rollups()
+
+
+def hot_queries():
+    """(name, statement) pairs for the predicates our busiest routes filter on.
+
+    Built from the same query builders the routes use wherever one exists,
+    so check-indexes follows the code instead of a copy of it.
+    """
+    return [
+        ('chat poll', new_messages_query(1, 100).statement),
+        ('chat poll cursor', latest_message_query(1).statement),
+        ('chat thread window', thread_query(1, 2).limit(50).statement),
+        ('chat thread older page', thread_query(1, 2, before=(datetime(2025, 1, 1), 100)).limit(50).statement),
+        ('chat inbox', conversations_query(1, 'student').statement),
+        ('unread message total', unread_count_query(1).statement),
+        ('teacher requests by status', TutorRequest.query.filter_by(teacher_id=1, status='pending').statement),
+        ('student requests by status', TutorRequest.query.filter_by(student_id=1, status='accepted').statement),
+        ('active payment cycle', PaymentCycle.query.filter_by(student_id=1, teacher_id=2, status='active').statement),
+        ('teacher payment cycles', PaymentCycle.query.filter_by(teacher_id=1).filter(PaymentCycle.status.in_(PENDING_PAYMENT_STATUSES)).statement),
+        ('recently paid cycles', PaymentCycle.query.filter_by(status='paid').order_by(PaymentCycle.payment_verified_at.desc()).limit(20).statement),
+        ('student class sessions', ClassSession.query.filter_by(student_id=1).order_by(ClassSession.date.desc()).statement),
+        ('recent users by role', User.query.filter_by(role='student').order_by(User.created_at.desc()).limit(5).statement),
+        ('tutor search', rank_tutors(search_tutors(city='Delhi', subject='mathematics', mode='both', max_price=800)).limit(21).statement),
+        ('tutor search next page', rank_tutors(search_tutors()).filter(after_search_cursor(True, 4.5, 500, 1)).limit(21).statement),
+        ('admin student listing', admin_students_query().limit(10).statement),
+        ('admin teacher listing', admin_teachers_query().limit(10).statement),
+        ('admin listing connections', accepted_partners_query(TutorRequest.student_id, TutorRequest.teacher_id, [1, 2, 3]).statement),
+    ]
+
+
+def explain_hot_queries():
+    """EXPLAIN each hot query; returns (name, plan, uses_index) tuples."""
+    dialect = db.engine.dialect
+    results = []
+    with db.engine.connect() as connection:
+        if dialect.name == 'postgresql':
+            # Tiny tables always favour a sequential scan; ask whether an index *can* serve the query
+            connection.execute(db.text('SET enable_seqscan = off'))
+        for name, statement in hot_queries():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            if dialect.name == 'sqlite':
+                plan = '\n'.join(row[-1] for row in connection.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+                uses_index = not any(line.strip().startswith('SCAN') and 'INDEX' not in line for line in plan.splitlines())
+            else:
+                plan = '\n'.join(row[0] for row in connection.execute(db.text(f'EXPLAIN {sql}')))
+                uses_index = 'Seq Scan' not in plan
+            results.append((name, plan, uses_index))
+    return results
+
+
+@commands.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database and backfill derived tables."""
+    initialize_database()
+    print('Database initialized')
+
+
+@commands.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Add missing tables, columns and indexes to an existing database."""
+    upgrade_database()
+    print('Database schema is up to date')
+
+
+@commands.cli.command('check-indexes')
+def check_indexes_command():
+    """Fail if any hot query would fall back to a full table scan."""
+    failures = 0
+    for name, plan, uses_index in explain_hot_queries():
+        print(f"{'OK  ' if uses_index else 'SCAN'} {name}")
+        if not uses_index:
+            failures += 1
+            print('     ' + plan.replace('\n', '\n     '))
+    if failures:
+        raise SystemExit(1)
+
+
+@commands.cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(EXPORT_ENTITIES)))
+@click.option('--format', 'export_format', type=click.Choice(exports.FORMATS), default='jsonl')
+@click.option('--since-id', type=int, help='Only rows with an id above this watermark.')
+@click.option('--since', type=click.DateTime(), help='Only rows created after this time.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), required=True, help='Destination file; gzip-compressed when it ends in .gz.')
+def export_command(entity, export_format, since_id, since, output):
+    """Export one entity as JSONL or columnar JSON, optionally incrementally."""
+    columns, rows, watermark = export_rows(entity, since_id=since_id, since=since)
+    body = exports.iter_rows(export_format, columns, rows)
+    if output.endswith('.gz'):
+        with open(output, 'wb') as f:
+            for chunk in iter_gzip(body):
+                f.write(chunk)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            for chunk in body:
+                f.write(chunk)
+    # The nightly sync stores this and passes it back as --since-id
+    print(watermark)
+
+
+@commands.cli.command('benchmark-hashing')
+@click.option('--method', 'methods', multiple=True, help='Werkzeug hash method to measure; repeatable. Defaults to the configured one.')
+@click.option('--seconds', type=float, default=2.0, help='How long to measure each method.')
+@click.option('--workers', type=int, help='Verification pool size (defaults to PASSWORD_HASH_WORKERS).')
+def benchmark_hashing_command(methods, seconds, workers):
+    """Report verified logins per second for each password hashing setting."""
+    workers = workers or current_app.config['PASSWORD_HASH_WORKERS']
+    for method in methods or [current_app.config['PASSWORD_HASH_METHOD']]:
+        hasher = PasswordHasher(method, workers)
+        rate = hasher.benchmark(seconds)
+        hasher.shutdown()
+        print(f'{hasher.method_prefix():<28} {rate:8.1f} logins/sec ({workers} workers)')
+
+
+@commands.cli.command('cleanup-sessions')
+def cleanup_sessions_command():
+    """Delete expired server-side sessions."""
+    store = session_store()
+    if not store:
+        print('Sessions are stored in cookies; nothing to clean up')
+        return
+    print(f"{store.cleanup(current_app.config['SESSION_CLEANUP_BATCH'])} expired sessions deleted")
+
+
+@commands.cli.command('revoke-sessions')
+@click.argument('email')
+def revoke_sessions_command(email):
+    """Sign a user out everywhere by deleting their server-side sessions."""
+    store = session_store()
+    user = User.query.filter_by(email=email).first()
+    if not store or not user:
+        print('No server-side sessions configured' if not store else f'No user with email {email}')
+        return
+    print(f'{store.delete_for_user(user.id)} sessions revoked for {email}')
+
+
+@commands.cli.command('reconcile-metrics')
+def reconcile_metrics_command():
+    """Recount the admin dashboard metrics from the underlying tables."""
+    reconcile_metrics()
+    for name, value in get_metrics().items():
+        print(f'{name}: {value}')
+
+
+@commands.cli.command('rebuild-earnings')
+def rebuild_earnings_command():
+    """Rebuild the monthly earnings rollup from the paid payment cycles."""
+    rebuild_earnings_rollups()
+    print(f'{EarningsRollup.query.count()} monthly earnings rows rebuilt')
+
+
+@commands.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the tutor search lookup tables from teacher profiles."""
+    rebuild_search_index()
+    print('Tutor search index rebuilt')
+
+
+@commands.cli.command('rebuild-conversations')
+def rebuild_conversations_command():
+    """Rebuild the chat conversation summaries from the messages table."""
+    rebuild_conversations()
+    print('Conversation summaries rebuilt')
+
+
+# ===== APPLICATION FACTORY =====
+
+def create_app(config_name=None):
+    """Build the app for a config.py `config` name, defaulting to $FLASK_CONFIG, then 'default'.
+
+    No database work happens here, so gunicorn can --preload the app and fork
+    workers cheaply; `flask --app app init-db` prepares the database instead.
+    """
+    app = Flask(__name__)
+    config_class = config[config_name or os.environ.get('FLASK_CONFIG') or 'default']
+    app.config.from_object(config_class)
+    config_class.init_app(app)
+    db.init_app(app)
+
+    # Chat fan-out; replace with a shared broker when running several workers
+    app.extensions['chat_broker'] = LocalBroker()
+    app.extensions['chat_poll_waiters'] = threading.BoundedSemaphore(app.config['CHAT_POLL_MAX_WAITERS'])
+
+    # Outbound email, sent by jobs over one reused SMTP connection (see utils/mailer.py)
+    app.extensions['mailer'] = Mailer(
+        app.config['MAIL_SERVER'],
+        app.config['MAIL_PORT'],
+        username=app.config['MAIL_USERNAME'],
+        password=app.config['MAIL_PASSWORD'],
+        use_tls=app.config['MAIL_USE_TLS'],
+        idle_timeout=app.config['MAIL_IDLE_TIMEOUT'],
+    )
+
+    # Payment screenshots are processed here after the upload commits (see utils/background.py)
+    app.extensions['upload_pool'] = BackgroundPool(app.config['UPLOAD_PROCESSING_WORKERS'], name='upload-processing')
+
+    # Password hashing cost and verification pool (see utils/passwords.py)
+    app.extensions['password_hasher'] = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_HASH_WORKERS'])
+
+    # Login rate limiting (see utils/ratelimit.py); request.remote_addr must be the real
+    # client, so trust X-Forwarded-For from as many proxies as we sit behind
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    rate_limiter = RateLimiter(create_backend(app.config['RATELIMIT_STORAGE_URL']))
+    rate_limiter.add_limit('login_ip', app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE'])
+    rate_limiter.add_limit('login_email', app.config['LOGIN_EMAIL_BURST'], app.config['LOGIN_EMAIL_PER_MINUTE'])
+    app.extensions['rate_limiter'] = rate_limiter
+
+    # Optional server-side sessions (see utils/sessions.py)
+    if app.config['SESSION_BACKEND'] == 'sql':
+        app.session_interface = ServerSideSessionInterface(SQLSessionStore(lambda: db.engine, ServerSession.__table__))
+    elif app.config['SESSION_BACKEND'] == 'memory':
+        app.session_interface = ServerSideSessionInterface(MemorySessionStore())
+
+    # Per-process dashboard counters and the admin id set
+    app.extensions['dashboard_cache'] = TTLCache(ttl=app.config['DASHBOARD_CACHE_TTL'])
+    # Admin metric increments, written in batches (see bump_metric)
+    app.extensions['metric_buffer'] = CounterBuffer()
+    app.teardown_appcontext(flush_metrics)
+    if not app.testing:
+        # Test apps drop their database before the interpreter exits
+        atexit.register(flush_metrics_at_exit, app)
+    app.extensions['user_loader'] = get_current_user
+
+    for rule, view_func, options in view_rules:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    app.context_processor(inject_user)
+    app.register_blueprint(commands)
+    return app
+
+
+# ===== RUN APP =====
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
+    app = create_app()
+    with app.app_context():
+        initialize_database()
+    app.run(debug=True, host='0.0.0.0', port=8000)
@@ -1,6 +1,15 @@
 import os
 from datetime import timedelta
 
+
+def database_url(name, default):
+    """Database URL from the environment; Heroku-style postgres:// URLs are rewritten for SQLAlchemy."""
+    url = os.environ.get(name) or default
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
 class Config:
     """Base configuration class"""
     
@@ -8,36 +17,87 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'vaanyan-home-tuition-secret-key-2025'
     
     # Database configuration
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///vaanyan_tuition.db'
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL', 'sqlite:///vaanyan_tuition.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = True
+    SQLALCHEMY_RECORD_QUERIES = False
     
     # Session configuration
-    PERMANENT_SESSION_LIFETIME = timedelta(days=30)
+    PERMANENT_SESSION_LIFETIME = timedelta(days=365)
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
+    # Session storage: 'cookie' (Flask's signed cookie), 'sql' (sessions table, opaque id
+    # in the cookie) or 'memory' (server-side but per process; development only)
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'cookie'
+    SESSION_CLEANUP_INTERVAL = 3600  # seconds between expired-session sweeps
+    SESSION_CLEANUP_BATCH = 1000  # rows deleted per statement
+    
     # Application settings
     DEBUG = True
     TESTING = False
     
     # Pagination
-    ITEMS_PER_PAGE = 10
+    ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE') or 10)
+    CHAT_PAGE_SIZE = int(os.environ.get('CHAT_PAGE_SIZE') or 50)
+    EXPORT_BATCH_SIZE = 1000  # rows fetched per round-trip by streaming exports
+    EXPORT_WATERMARK_LAG = 60  # seconds; incremental exports stop at rows older than this
+    BULK_LOG_MAX_SESSIONS = 500  # class sessions accepted per bulk log upload
+    
+    # Dashboard caches: per-user counters and the admin id set (seconds)
+    DASHBOARD_CACHE_TTL = 30
+    ADMIN_IDS_CACHE_TTL = 300
+    
+    # Real-time chat long-polling (seconds). A waiting poll holds a gthread worker thread,
+    # so polls wait at most CHAT_POLL_TIMEOUT and at most CHAT_POLL_MAX_WAITERS wait at once
+    # per process; the rest answer immediately and the client retries after CHAT_POLL_INTERVAL.
+    # Keep CHAT_POLL_MAX_WAITERS well below gunicorn's --threads (8 in the Procfile).
+    CHAT_POLL_TIMEOUT = 5
+    CHAT_POLL_MAX_WAITERS = 3
+    CHAT_POLL_INTERVAL = 3
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'static/uploads'
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
+    PAYMENT_UPLOAD_FOLDER = 'static/payments'
+    PAYMENT_IMAGE_MAX_DIMENSION = 1600  # screenshots are downscaled to fit this many pixels
+    PAYMENT_THUMBNAIL_SIZE = 320
+    UPLOAD_PROCESSING_WORKERS = 1  # threads per web process recompressing uploads
     
-    # Email configuration (for future use)
+    # Email configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME') or 'mahapatravinayak@gmail.com'
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL') or 'mahapatravinayak@gmail.com'  # receives new-request notifications
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@vaanyan.com'
     
+    # Password hashing: Werkzeug method string (e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000')
+    # and how many hashes may run at once per process. Stored hashes are migrated on login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    
+    # Login rate limits: burst size and refill per minute, per client IP and per account email.
+    # Buckets live in-process unless RATELIMIT_STORAGE_URL points at a shared store (redis://...).
+    LOGIN_IP_BURST = 20
+    LOGIN_IP_PER_MINUTE = 10
+    LOGIN_EMAIL_BURST = 5
+    LOGIN_EMAIL_PER_MINUTE = 1
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 0)  # proxies whose X-Forwarded-For is believed
+    
+    # Seconds the job worker keeps an unused SMTP connection open
+    MAIL_IDLE_TIMEOUT = int(os.environ.get('MAIL_IDLE_TIMEOUT') or 30)
+    
+    # Background jobs: worker pool size, idle poll interval and when a running job counts as abandoned (seconds)
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS') or 4)
+    JOB_POLL_INTERVAL = 2
+    JOB_STALE_AFTER = 600
+    METRICS_RECONCILE_INTERVAL = 3600
+    METRICS_FLUSH_INTERVAL = 10  # how long admin metric increments are buffered per process before being written
+    
     # Application specific settings
     VAANYAN_ADMIN_EMAIL = os.environ.get('VAANYAN_ADMIN_EMAIL') or 'admin@vaanyan.com'
     VAANYAN_SUPPORT_EMAIL = os.environ.get('VAANYAN_SUPPORT_EMAIL') or 'support@vaanyan.com'
@@ -53,24 +113,28 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or 'sqlite:///vaanyan_tuition_dev.db'
+    SQLALCHEMY_DATABASE_URI = database_url('DEV_DATABASE_URL', 'sqlite:///vaanyan_tuition_dev.db')
+    SQLALCHEMY_RECORD_QUERIES = True
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
+    SQLALCHEMY_DATABASE_URI = database_url('TEST_DATABASE_URL', 'sqlite:///:memory:')
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     
-    # Production database (PostgreSQL recommended)
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///vaanyan_tuition_prod.db'
+    # Production database: DATABASE_URL (PostgreSQL recommended), else the base SQLite file
     
     # Security settings for production
     SESSION_COOKIE_SECURE = True  # Requires HTTPS
     SESSION_COOKIE_HTTPONLY = True
-    SESSION_COOKIE_SAMESITE = 'Strict'
+    SESSION_COOKIE_SAMESITE = 'Lax'  # Strict would drop the session on links arriving from email or other sites
+    
+    # Behind the Heroku router every request comes from the router's address; without
+    # this all visitors would share one login rate limit bucket. Set 0 if serving directly.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 1)
     
     @classmethod
     def init_app(cls, app):
@@ -88,5 +152,6 @@ config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
-    'default': DevelopmentConfig
+    # What the app ran with before create_app() existed: DATABASE_URL or vaanyan_tuition.db, no debug
+    'default': ProductionConfig
 }
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import event
+
+from app import create_app, initialize_database
+from models import db
+
+
+@pytest.fixture
+def app():
+    """A fresh app on an in-memory database.
+
+    No app context stays pushed, so every test client request gets its own
+    context (and g, session and teardown handlers) just like in production.
+    Seed data inside `with app.app_context():`, or use the app_context
+    fixture for tests that call app functions directly.
+    """
+    app = create_app('testing')
+    # A cheap hash keeps seeding fast; the cost is irrelevant to these tests
+    app.extensions['password_hasher'].method = 'pbkdf2:sha256:1000'
+    with app.app_context():
+        initialize_database()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """Returns a list that collects every statement sent to the database from now on."""
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,36 @@
+"""Builders for test data. Call them inside an app context and commit afterwards."""
+from app import sync_teacher_search_terms
+from models import db, StudentProfile, TeacherProfile, TutorRequest, User
+
+
+def make_user(role, email, password='password', **fields):
+    user = User(role=role, first_name=fields.pop('first_name', role.title()), last_name='Test', email=email, phone='9999999999')
+    user.set_password(password)
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def make_teacher(index, city='Delhi', subjects='mathematics,physics', teaching_mode='home_tuition,online', hourly_rate=500, **fields):
+    user = make_user('teacher', f'teacher{index}@example.com', first_name=f'Teacher{index}')
+    profile = TeacherProfile(user_id=user.id, qualification='M.Sc', experience='5', subjects=subjects, teaching_mode=teaching_mode,
+                             hourly_rate=hourly_rate, bio='', city=city, address='Street 1', **fields)
+    sync_teacher_search_terms(profile)
+    db.session.add(profile)
+    return user
+
+
+def make_student(index, city='Delhi'):
+    user = make_user('student', f'student{index}@example.com', first_name=f'Student{index}')
+    db.session.add(StudentProfile(user_id=user.id, grade='10', board='cbse', subjects='mathematics', city=city, address='Street 2'))
+    return user
+
+
+def connect(student, teacher, status='accepted'):
+    request = TutorRequest(student_id=student.id, teacher_id=teacher.id, subject='mathematics', status=status)
+    db.session.add(request)
+    return request
+
+
+def login(client, email, password='password', admin=False):
+    return client.post('/admin/login' if admin else '/login', data={'email': email, 'password': password})
@@ -0,0 +1,27 @@
+from app import admin_student_listing, admin_teacher_listing
+from models import db
+from tests.factories import connect, make_student, make_teacher
+
+
+def test_listing_pages_are_disjoint_with_per_page_counts(app, app_context):
+    teachers = [make_teacher(i) for i in range(3)]
+    students = [make_student(i) for i in range(25)]
+    for i, student in enumerate(students):
+        for teacher in teachers[:i % 4]:
+            connect(student, teacher)
+    connect(students[0], teachers[0], status='pending')
+    db.session.commit()
+    per_page = app.config['ITEMS_PER_PAGE']
+    seen = []
+    for page in range(1, 4):
+        student_data, pagination = admin_student_listing(page=page)
+        assert len(student_data) <= per_page
+        seen += [row['student'].id for row in student_data]
+        for row in student_data:
+            expected = students.index(row['student']) % 4
+            assert row['total_classes'] == expected
+            assert [teacher.id for teacher in row['teachers']] == [teacher.id for teacher in teachers[:expected]]
+    assert seen == sorted(student.id for student in students)
+
+    teacher_data, _ = admin_teacher_listing()
+    assert [row['total_students'] for row in teacher_data] == [18, 12, 6]
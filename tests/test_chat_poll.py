@@ -0,0 +1,142 @@
+import re
+import time
+
+import pytest
+
+from app import get_conversations, get_unread_count, record_message
+from models import db, Conversation, Message, User
+from tests.factories import connect, login, make_student, make_teacher
+
+
+@pytest.fixture
+def pair(app, client):
+    app.config['CHAT_POLL_TIMEOUT'] = 0.2
+    with app.app_context():
+        student = make_student(1)
+        teacher = make_teacher(1)
+        connect(student, teacher)
+        record_message(teacher.id, student.id, 'hello')
+        db.session.commit()
+        ids = student.id, teacher.id
+    login(client, 'student1@example.com')
+    return ids
+
+
+def test_first_poll_returns_cursor(client, pair):
+    data = client.get('/chat/poll').get_json()
+    assert data['messages'] == []
+    assert data['after'] > 0
+
+
+def test_poll_returns_new_messages_at_once(app, client, pair):
+    student_id, teacher_id = pair
+    after = client.get('/chat/poll').get_json()['after']
+    with app.app_context():
+        record_message(teacher_id, student_id, 'are you there?')
+        db.session.commit()
+    data = client.get(f'/chat/poll?after={after}').get_json()
+    assert [msg['message'] for msg in data['messages']] == ['are you there?']
+    assert data['after'] == data['messages'][-1]['id']
+
+
+def test_idle_poll_waits_at_most_the_timeout(client, pair):
+    after = client.get('/chat/poll').get_json()['after']
+    started = time.monotonic()
+    data = client.get(f'/chat/poll?after={after}').get_json()
+    assert data == {'messages': [], 'after': after, 'retry_ms': 0}
+    assert time.monotonic() - started < 2
+
+
+def test_poll_does_not_wait_when_waiters_are_busy(app, client, pair):
+    after = client.get('/chat/poll').get_json()['after']
+    waiters = app.extensions['chat_poll_waiters']
+    for _ in range(app.config['CHAT_POLL_MAX_WAITERS']):
+        waiters.acquire()
+    app.config['CHAT_POLL_TIMEOUT'] = 30
+    started = time.monotonic()
+    data = client.get(f'/chat/poll?after={after}').get_json()
+    assert data['retry_ms'] == app.config['CHAT_POLL_INTERVAL'] * 1000
+    assert time.monotonic() - started < 1
+
+
+def test_poll_marks_the_open_threads_messages_read(app, client, pair):
+    student_id, teacher_id = pair
+    client.get(f'/chat/{teacher_id}')
+    after = client.get(f'/chat/poll?partner={teacher_id}').get_json()['after']
+    with app.app_context():
+        record_message(teacher_id, student_id, 'are you there?')
+        db.session.commit()
+        assert get_unread_count(student_id) == 1
+    data = client.get(f'/chat/poll?partner={teacher_id}&after={after}').get_json()
+    assert [msg['message'] for msg in data['messages']] == ['are you there?']
+    with app.app_context():
+        assert get_unread_count(student_id) == 0
+        assert get_conversations(db.session.get(User, student_id))[0]['unread_count'] == 0
+
+
+def test_poll_finds_messages_published_elsewhere(app, client, pair, monkeypatch):
+    student_id, teacher_id = pair
+    after = client.get('/chat/poll').get_json()['after']
+    subscribe = app.extensions['chat_broker'].subscribe
+
+    def subscribe_and_miss_a_message(channel):
+        subscription = subscribe(channel)
+        wait = subscription.get
+
+        def get(timeout=None):
+            # Committed by another worker, whose broker never wakes this one
+            with app.app_context():
+                record_message(teacher_id, student_id, 'from another worker')
+                db.session.commit()
+            return wait(timeout)
+
+        subscription.get = get
+        return subscription
+
+    monkeypatch.setattr(app.extensions['chat_broker'], 'subscribe', subscribe_and_miss_a_message)
+    data = client.get(f'/chat/poll?after={after}').get_json()
+    assert [msg['message'] for msg in data['messages']] == ['from another worker']
+
+
+def test_chat_page_renders_the_poll_cursor(client, pair):
+    student_id, teacher_id = pair
+    after = client.get('/chat/poll').get_json()['after']
+    assert f'data-poll-after="{after}"'.encode() in client.get(f'/chat/{teacher_id}').data
+
+
+def test_sending_to_an_unknown_user_is_rejected(app, client, pair):
+    response = client.post('/api/messages', json={'recipient_id': 9999, 'message': 'hello?'})
+    assert response.status_code == 404
+    with app.app_context():
+        assert db.session.query(Message).filter_by(recipient_id=9999).count() == 0
+        assert db.session.query(Conversation).count() == 1
+
+
+def test_older_pages_walk_back_to_the_first_message(app, client, pair):
+    student_id, teacher_id = pair
+    app.config['CHAT_PAGE_SIZE'] = 3
+    with app.app_context():
+        for i in range(7):
+            record_message(student_id if i % 2 else teacher_id, teacher_id if i % 2 else student_id, f'message {i}')
+        db.session.commit()
+        # Share one timestamp across a page boundary so the id has to break the tie
+        first = Message.query.order_by(Message.id).first()
+        Message.query.filter(Message.id <= first.id + 4).update({'created_at': first.created_at})
+        db.session.commit()
+        expected = [msg.message for msg in Message.query.order_by(Message.id)]
+    page = client.get(f'/chat/{teacher_id}').get_data(as_text=True)
+    before = re.search(r'data-before="([^"]+)"', page).group(1)
+    seen = []
+    while before:
+        data = client.get(f'/chat/{teacher_id}/older?before={before}').get_json()
+        assert len(data['messages']) <= 3
+        seen = [msg['message'] for msg in data['messages']] + seen
+        before = data['older_cursor']
+    assert seen[0] == 'hello'
+    assert seen == expected[:-3]
+
+
+def test_older_messages_reject_an_invalid_cursor(client, pair):
+    student_id, teacher_id = pair
+    assert client.get(f'/chat/{teacher_id}/older?before=yesterday').status_code == 400
+    assert client.get(f'/chat/{teacher_id}/older').status_code == 400
@@ -0,0 +1,68 @@
+import io
+from datetime import date
+
+import pytest
+
+from app import CLASSES_PER_CYCLE, bill_classes, get_active_cycle, log_class_session
+from models import db, ClassSession, PaymentCycle
+from tests.factories import connect, login, make_student, make_teacher
+
+
+def test_bulk_log_rejects_non_utf8_csv(app, client):
+    with app.app_context():
+        connect(make_student(1), make_teacher(1))
+        db.session.commit()
+    login(client, 'teacher1@example.com')
+    upload = io.BytesIO('student_id,date,notes\n1,2025-01-06,caf\xe9\n'.encode('latin-1'))
+    response = client.post('/teacher/log-classes', data={'file': (upload, 'classes.csv')}, follow_redirects=True)
+    assert response.status_code == 200
+    assert b'The file must be a UTF-8 CSV' in response.data
+
+
+@pytest.fixture
+def pair(app_context):
+    student = make_student(1)
+    teacher = make_teacher(1)
+    request = connect(student, teacher)
+    db.session.commit()
+    return student, teacher, request
+
+
+def test_stale_bill_is_rejected_and_retried(pair, monkeypatch):
+    student, teacher, _ = pair
+    calls = []
+
+    def get_active_cycle_then_bill_concurrently(student_id, teacher_id):
+        cycle = get_active_cycle(student_id, teacher_id)
+        if not calls:
+            # Another request bills a class between our read and our update
+            cycles = PaymentCycle.__table__
+            db.session.execute(cycles.update().where(cycles.c.id == cycle.id).values(total_classes=cycles.c.total_classes + 1, total_amount=cycles.c.total_amount + 300))
+        calls.append(cycle.total_classes)
+        return cycle
+
+    monkeypatch.setattr('app.get_active_cycle', get_active_cycle_then_bill_concurrently)
+    bill_classes(student.id, teacher.id, [500])
+    db.session.commit()
+    cycle = PaymentCycle.query.one()
+    assert calls == [0, 1]
+    assert (cycle.total_classes, cycle.total_amount, cycle.commission, cycle.teacher_earning) == (2, 800, 80, 720)
+
+
+def test_full_cycle_rolls_over_into_a_new_one(pair):
+    student, teacher, _ = pair
+    bill_classes(student.id, teacher.id, [100] * (CLASSES_PER_CYCLE + 5))
+    db.session.commit()
+    closed, active = PaymentCycle.query.order_by(PaymentCycle.id).all()
+    assert (closed.status, closed.total_classes, closed.total_amount) == ('pending_payment', CLASSES_PER_CYCLE, 100 * CLASSES_PER_CYCLE)
+    assert (active.status, active.total_classes, active.total_amount) == ('active', 5, 500)
+
+
+def test_resubmitted_class_is_billed_once(pair):
+    student, teacher, request = pair
+    for _ in range(2):
+        session_record, created = log_class_session(teacher, student.id, request.id, date(2025, 1, 6), 1.5, idempotency_key='form-1')
+        db.session.commit()
+    assert not created
+    assert ClassSession.query.count() == 1
+    assert PaymentCycle.query.one().total_amount == 750
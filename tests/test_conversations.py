@@ -0,0 +1,30 @@
+from app import get_conversations, mark_conversation_read, record_message
+from models import db
+from tests.factories import connect, make_student, make_teacher
+
+
+def test_inbox_shows_last_message_and_unread_counts_in_one_query(app_context, count_queries):
+    student = make_student(1)
+    quiet, busy, silent = make_teacher(1), make_teacher(2), make_teacher(3)
+    for teacher in (quiet, busy, silent):
+        connect(student, teacher)
+    connect(student, make_teacher(4), status='pending')
+    record_message(quiet.id, student.id, 'hello')
+    record_message(busy.id, student.id, 'first')
+    record_message(busy.id, student.id, 'second')
+    record_message(student.id, busy.id, 'reply')
+    db.session.commit()
+
+    db.session.refresh(student)
+    count_queries.clear()
+    inbox = get_conversations(student)
+    assert len(count_queries) == 1
+    # Latest conversation first, partners without messages last, pending requests left out
+    assert [(row['id'], row['last_message'], row['unread_count']) for row in inbox] == [
+        (busy.id, 'reply', 2), (quiet.id, 'hello', 1), (silent.id, 'No messages yet', 0)]
+
+    mark_conversation_read(student.id, busy.id)
+    db.session.commit()
+    assert [row['unread_count'] for row in get_conversations(student)] == [0, 1, 0]
+    # The other side counts its own unread messages
+    assert get_conversations(busy)[0]['unread_count'] == 1
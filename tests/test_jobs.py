@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timedelta
+
+from app import claim_jobs, enqueue_job, enqueue_periodic_job, job_handlers, requeue_stale_jobs, run_job, schedule_periodic_jobs, send_admin_notification
+from models import db, Job
+
+
+def test_mail_failure_fails_the_job_attempt(app, app_context):
+    mailer = app.extensions['mailer']
+    # Nothing listens on port 1, so connecting fails straight away
+    mailer.server, mailer.port = '127.0.0.1', 1
+    job = enqueue_job('send_admin_notification', subject='New request', body='<p>Hi</p>')
+    db.session.commit()
+    assert claim_jobs('test-worker', 1) == [job.id]
+    assert run_job(job.id) == 'queued'
+    job = db.session.get(Job, job.id)
+    assert job.attempts == 1
+    assert 'ConnectionRefusedError' in job.last_error
+
+
+def test_stale_jobs_are_requeued_until_out_of_attempts(app, app_context):
+    started_at = datetime.utcnow() - timedelta(seconds=app.config['JOB_STALE_AFTER'] + 60)
+    retry = Job(name='send_admin_notification', status='running', attempts=1, max_attempts=3, started_at=started_at, locked_by='dead')
+    exhausted = Job(name='send_admin_notification', status='running', attempts=3, max_attempts=3, started_at=started_at, locked_by='dead')
+    db.session.add_all([retry, exhausted])
+    db.session.commit()
+    assert requeue_stale_jobs() == 1
+    db.session.expire_all()
+    assert (retry.status, retry.locked_by) == ('queued', None)
+    assert exhausted.status == 'failed'
+    assert exhausted.finished_at is not None
+
+
+def queued(name):
+    return Job.query.filter_by(name=name, status='queued').all()
+
+
+def test_periodic_job_is_rescheduled_when_it_fails(app, app_context, monkeypatch):
+    def broken():
+        raise RuntimeError('reconcile failed')
+
+    monkeypatch.setitem(job_handlers, 'reconcile_metrics', broken)
+    schedule_periodic_jobs()
+    job_id, = [job.id for job in queued('reconcile_metrics')]
+    claim_jobs('test-worker', 5)
+    assert run_job(job_id) == 'failed'
+    next_run, = queued('reconcile_metrics')
+    assert next_run.run_at > datetime.utcnow() + timedelta(seconds=app.config['METRICS_RECONCILE_INTERVAL'] - 60)
+
+
+def test_periodic_jobs_are_seeded_once(app_context):
+    schedule_periodic_jobs()
+    schedule_periodic_jobs()
+    # As if another worker seeded it between the check and the insert
+    enqueue_periodic_job('cleanup_sessions')
+    db.session.commit()
+    assert len(queued('reconcile_metrics')) == 1
+    assert len(queued('cleanup_sessions')) == 1
+
+
+def test_admin_notification_is_a_durable_job(app_context):
+    send_admin_notification('New request', '<p>Hi</p>')
+    db.session.commit()
+    job, = Job.query.filter_by(name='send_admin_notification').all()
+    assert json.loads(job.payload) == {'subject': 'New request', 'body': '<p>Hi</p>'}
+    assert job.status == 'queued' and not job.periodic
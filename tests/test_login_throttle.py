@@ -0,0 +1,48 @@
+import pytest
+
+import config
+from app import create_app, initialize_database
+from models import db
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(config.TestingConfig, 'TRUSTED_PROXIES', 1)
+    app = create_app('testing')
+    with app.app_context():
+        initialize_database()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def attempt(client, forwarded_for, email, path='/login'):
+    return client.post(path, data={'email': email, 'password': 'wrong'}, headers={'X-Forwarded-For': forwarded_for})
+
+
+def test_forwarded_clients_get_separate_ip_buckets(app, client):
+    burst = app.config['LOGIN_IP_BURST']
+    for i in range(burst):
+        assert attempt(client, '203.0.113.1', f'user{i}@example.com').status_code == 302
+    assert attempt(client, '203.0.113.1', 'another@example.com').status_code == 429
+    assert attempt(client, '203.0.113.2', 'another@example.com').status_code == 302
+
+
+
+def test_one_email_is_throttled_across_ips(app, client):
+    for i in range(app.config['LOGIN_EMAIL_BURST']):
+        assert attempt(client, f'198.51.100.{i}', 'victim@example.com').status_code == 302
+    response = attempt(client, '198.51.100.99', ' Victim@Example.com ')
+    assert response.status_code == 429
+    # One token back at LOGIN_EMAIL_PER_MINUTE a minute
+    assert 0 < int(response.headers['Retry-After']) <= 60 // app.config['LOGIN_EMAIL_PER_MINUTE']
+    assert attempt(client, '198.51.100.99', 'someone-else@example.com').status_code == 302
+
+
+def test_admin_login_shares_the_throttle(app, client):
+    for i in range(app.config['LOGIN_EMAIL_BURST']):
+        assert attempt(client, f'198.51.100.{i}', 'admin@example.com', path='/admin/login').status_code == 302
+    response = attempt(client, '198.51.100.99', 'admin@example.com', path='/admin/login')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert attempt(client, '198.51.100.99', 'admin@example.com').status_code == 429
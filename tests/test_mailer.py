@@ -0,0 +1,83 @@
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from utils.mailer import Mailer
+
+controller = pytest.importorskip('aiosmtpd.controller')
+
+
+class RecordingHandler:
+    """Records each delivered message's subject with the client port it came from."""
+
+    def __init__(self):
+        self.delivered = []
+
+    async def handle_DATA(self, server, session, envelope):
+        subject = next(line for line in envelope.content.decode().splitlines() if line.startswith('Subject: '))
+        self.delivered.append((session.peer[1], subject[len('Subject: '):]))
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    server = controller.Controller(handler, hostname='127.0.0.1', port=free_port())
+    server.start()
+    yield server, handler
+    server.stop()
+
+
+@pytest.fixture
+def mailer(smtp_server):
+    server, handler = smtp_server
+    mailer = Mailer(server.hostname, server.port, use_tls=False, idle_timeout=30)
+    yield mailer
+    mailer.close()
+
+
+def message(subject):
+    msg = EmailMessage()
+    msg['From'] = 'noreply@example.com'
+    msg['To'] = 'admin@example.com'
+    msg['Subject'] = subject
+    msg.set_content('Hello')
+    return msg
+
+
+def test_sends_share_one_smtp_session(smtp_server, mailer):
+    server, handler = smtp_server
+    for i in range(3):
+        mailer.send(message(f'notification {i}'))
+    assert [subject for port, subject in handler.delivered] == [f'notification {i}' for i in range(3)]
+    assert len({port for port, subject in handler.delivered}) == 1
+
+
+def test_a_dropped_session_is_reopened(smtp_server, mailer):
+    server, handler = smtp_server
+    mailer.send(message('before'))
+    # Tear the TCP connection down under the open session, as a server timing it out would
+    mailer._connection.sock.shutdown(socket.SHUT_RDWR)
+    mailer.send(message('after'))
+    (first_port, _), (second_port, _) = handler.delivered
+    assert [subject for port, subject in handler.delivered] == ['before', 'after']
+    assert first_port != second_port
+
+
+def test_an_idle_session_is_closed(smtp_server, mailer):
+    server, handler = smtp_server
+    mailer.idle_timeout = 0
+    mailer.send(message('first'))
+    time.sleep(0.01)
+    mailer.close_if_idle()
+    assert mailer._connection is None
+    mailer.send(message('second'))
+    assert len({port for port, subject in handler.delivered}) == 2
@@ -0,0 +1,81 @@
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import bump_metric, flush_metrics, get_metrics, reconcile_metrics, record_message
+from models import db, User
+from tests.factories import make_student, make_teacher
+
+
+def test_committed_increments_are_buffered_then_written(app_context):
+    student = make_student(1)
+    teacher = make_teacher(1)
+    db.session.commit()
+    flush_metrics(force=True)
+    before = get_metrics()['messages']
+    for i in range(3):
+        record_message(student.id, teacher.id, f'message {i}')
+        db.session.commit()
+    assert get_metrics()['messages'] == before
+    flush_metrics(force=True)
+    assert get_metrics()['messages'] == before + 3
+
+
+def test_rolled_back_increments_are_dropped(app_context):
+    flush_metrics(force=True)
+    before = get_metrics()['students']
+    bump_metric('students')
+    db.session.rollback()
+    flush_metrics(force=True)
+    assert get_metrics()['students'] == before
+
+
+def test_request_teardown_writes_due_increments(app, client):
+    app.config['METRICS_FLUSH_INTERVAL'] = 0
+    with app.app_context():
+        before = get_metrics()['students']
+    response = client.post('/student/register', data={
+        'first_name': 'New', 'last_name': 'Student', 'email': 'new@example.com', 'phone': '9000000000',
+        'grade': '10', 'board': 'CBSE', 'subjects': ['mathematics'], 'city': 'Delhi', 'address': 'Somewhere',
+        'password': 'password', 'confirm_password': 'password',
+    })
+    assert response.status_code == 302
+    with app.app_context():
+        assert get_metrics()['students'] == before + 1
+
+
+def test_savepoints_keep_the_outer_transactions_increments(app_context):
+    student = make_student(1)
+    teacher = make_teacher(1)
+    db.session.commit()
+    flush_metrics(force=True)
+    before = get_metrics()['students']
+    bump_metric('students')
+    # A savepoint that is released, then one rolled back as get_or_create does on a lost race
+    with db.session.begin_nested():
+        record_message(student.id, teacher.id, 'hello')
+    assert not current_app.extensions['metric_buffer'].drain()
+    try:
+        with db.session.begin_nested():
+            db.session.add(User(role='student', first_name='Dup', last_name='Test', email='student1@example.com', phone='1', password_hash='x'))
+    except IntegrityError:
+        pass
+    db.session.commit()
+    flush_metrics(force=True)
+    assert get_metrics()['students'] == before + 1
+
+
+def test_reconcile_is_not_followed_by_double_counting(app, app_context):
+    make_student(1)
+    bump_metric('students')
+    db.session.commit()
+    buffer = current_app.extensions['metric_buffer']
+    # Another web process still holds this committed registration when the worker reconciles
+    in_flight = buffer.drain()
+    assert in_flight
+    reconcile_metrics()
+    bump_metric('students')
+    make_student(2)
+    db.session.commit()
+    buffer.restore(in_flight)
+    flush_metrics(force=True)
+    assert get_metrics()['students'] == 2
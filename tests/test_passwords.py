@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+import utils.passwords
+from models import db, User
+from tests.factories import login, make_user
+from utils.passwords import PasswordHasher
+
+
+def test_hashing_runs_on_the_bounded_pool(monkeypatch):
+    threads = []
+    generate = utils.passwords.generate_password_hash
+
+    def recording_generate(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return generate(*args, **kwargs)
+
+    monkeypatch.setattr(utils.passwords, 'generate_password_hash', recording_generate)
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)
+    try:
+        password_hash = hasher.hash('secret')
+        assert hasher.verify(password_hash, 'secret')
+    finally:
+        hasher.shutdown()
+    assert threads and all(name.startswith('password-hash') for name in threads)
+
+
+
+def stored_hash(app, email):
+    with app.app_context():
+        return User.query.filter_by(email=email).one().password_hash
+
+
+@pytest.mark.parametrize('role, admin', [('student', False), ('admin', True)])
+def test_login_rehashes_with_the_configured_method(app, client, monkeypatch, role, admin):
+    with app.app_context():
+        make_user(role, 'user@example.com')
+        db.session.commit()
+    assert stored_hash(app, 'user@example.com').startswith('pbkdf2:sha256:1000$')
+    # The configured cost goes up after the password was stored
+    hasher = PasswordHasher('pbkdf2:sha256:2000', workers=1)
+    monkeypatch.setitem(app.extensions, 'password_hasher', hasher)
+    try:
+        login(client, 'user@example.com', password='wrong', admin=admin)
+        assert stored_hash(app, 'user@example.com').startswith('pbkdf2:sha256:1000$')
+        login(client, 'user@example.com', admin=admin)
+        password_hash = stored_hash(app, 'user@example.com')
+        assert password_hash.startswith('pbkdf2:sha256:2000$')
+        assert hasher.verify(password_hash, 'password')
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,49 @@
+from datetime import date
+
+import pytest
+
+from models import db, EarningsRollup, PaymentCycle, TeacherProfile
+from tests.factories import connect, login, make_student, make_teacher, make_user
+
+
+@pytest.fixture
+def cycle_id(app, client):
+    with app.app_context():
+        make_user('admin', 'admin@example.com')
+        student = make_student(1)
+        teacher = make_teacher(1)
+        connect(student, teacher)
+        cycle = PaymentCycle(student_id=student.id, teacher_id=teacher.id, start_date=date(2025, 1, 1), total_classes=25,
+                             total_amount=12500, commission=1250, teacher_earning=11250, status='pending_verification')
+        db.session.add(cycle)
+        db.session.commit()
+        cycle_id = cycle.id
+    login(client, 'admin@example.com', admin=True)
+    return cycle_id
+
+
+def test_second_approval_is_ignored(app, client, cycle_id):
+    client.post(f'/admin/verify-payment/{cycle_id}', data={'action': 'approve'})
+    client.post(f'/admin/verify-payment/{cycle_id}', data={'action': 'approve'})
+    with app.app_context():
+        assert TeacherProfile.query.one().total_earnings == 11250
+        assert [rollup.teacher_earning for rollup in EarningsRollup.query.all()] == [11250]
+        # Approval opens the pair's next cycle
+        assert PaymentCycle.query.filter_by(status='active').count() == 1
+
+
+def test_paid_cycle_cannot_be_rejected(app, client, cycle_id):
+    client.post(f'/admin/verify-payment/{cycle_id}', data={'action': 'approve'})
+    client.post(f'/admin/verify-payment/{cycle_id}', data={'action': 'reject'})
+    with app.app_context():
+        assert db.session.get(PaymentCycle, cycle_id).status == 'paid'
+        assert EarningsRollup.query.one().paid_cycles == 1
+
+
+def test_rejection_leaves_earnings_alone(app, client, cycle_id):
+    client.post(f'/admin/verify-payment/{cycle_id}', data={'action': 'reject'})
+    with app.app_context():
+        cycle = db.session.get(PaymentCycle, cycle_id)
+        assert (cycle.status, cycle.payment_screenshot, cycle.payment_verified_at) == ('pending_payment', None, None)
+        assert not TeacherProfile.query.one().total_earnings
+        assert EarningsRollup.query.count() == 0
@@ -0,0 +1,84 @@
+"""Hot routes run a fixed number of queries, however many rows they show."""
+import pytest
+from flask import session
+
+from app import get_current_user, record_message
+from models import db
+from tests.factories import connect, login, make_student, make_teacher, make_user
+
+TUTORS = 50
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        make_user('admin', 'admin@example.com')
+        student = make_student(1)
+        teachers = [make_teacher(i) for i in range(TUTORS)]
+        for teacher in teachers[:10]:
+            connect(student, teacher)
+        db.session.commit()
+
+
+def test_find_tutors(client, seeded, count_queries):
+    login(client, 'student1@example.com')
+    count_queries.clear()
+    response = client.get('/find-tutors?city=Delhi&subject=mathematics')
+    assert response.status_code == 200
+    assert b'Teacher1' in response.data
+    assert len(count_queries) <= 2
+
+
+def test_student_dashboard(client, seeded, count_queries):
+    login(client, 'student1@example.com')
+    count_queries.clear()
+    response = client.get('/student/dashboard')
+    assert response.status_code == 200
+    assert len(count_queries) <= 5
+
+
+def test_admin_teachers(client, seeded, count_queries):
+    login(client, 'admin@example.com', admin=True)
+    count_queries.clear()
+    response = client.get('/admin/teachers')
+    assert response.status_code == 200
+    assert b'teacher0@example.com' in response.data
+    assert len(count_queries) <= 4
+
+
+@pytest.mark.parametrize('message_count', [10, 60])
+def test_chat_thread(app, client, count_queries, message_count):
+    with app.app_context():
+        student = make_student(1)
+        teacher = make_teacher(1)
+        connect(student, teacher)
+        for i in range(message_count):
+            record_message(*((teacher.id, student.id) if i % 2 else (student.id, teacher.id)), f'message {i}')
+        db.session.commit()
+        teacher_id = teacher.id
+    login(client, 'student1@example.com')
+    count_queries.clear()
+    response = client.get(f'/chat/{teacher_id}')
+    assert response.status_code == 200
+    assert f'message {message_count - 1}'.encode() in response.data
+    assert len(count_queries) <= 8
+
+
+def test_current_user_is_loaded_once_per_request(app, count_queries):
+    with app.app_context():
+        teacher_id = make_teacher(1).id
+        db.session.commit()
+    with app.test_request_context():
+        session['user_id'] = teacher_id
+        session['user_role'] = 'teacher'
+        count_queries.clear()
+        user = get_current_user()
+        assert get_current_user() is user
+        # The role's profile comes with the user
+        assert user.teacher_profile.city == 'Delhi'
+        assert len(count_queries) == 1
+    with app.test_request_context():
+        session['user_id'] = teacher_id
+        count_queries.clear()
+        assert get_current_user().id == teacher_id
+        assert len(count_queries) == 1
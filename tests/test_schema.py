@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import config
+from app import create_app, explain_hot_queries, initialize_database, upgrade_database
+from models import db, User
+
+
+def test_hot_queries_use_indexes(app_context):
+    scans = [name for name, plan, uses_index in explain_hot_queries() if not uses_index]
+    assert scans == []
+
+
+def test_upgrade_adds_missing_columns(app_context):
+    with db.engine.begin() as connection:
+        connection.execute(db.text("UPDATE metric_counters SET value = 3 WHERE name = 'students'"))
+        connection.execute(db.text('DROP INDEX uq_class_sessions_teacher_idempotency'))
+        connection.execute(db.text('ALTER TABLE class_sessions DROP COLUMN idempotency_key'))
+        connection.execute(db.text('ALTER TABLE metric_counters DROP COLUMN value'))
+    upgrade_database()
+    upgrade_database()
+    inspector = db.inspect(db.engine)
+    assert 'idempotency_key' in {column['name'] for column in inspector.get_columns('class_sessions')}
+    assert 'uq_class_sessions_teacher_idempotency' in {index['name'] for index in inspector.get_indexes('class_sessions')}
+    # The NOT NULL column is filled in for existing rows from its server_default
+    assert db.session.execute(db.text("SELECT value FROM metric_counters WHERE name = 'students'")).scalar() == 0
+
+def test_models_import_without_the_web_app():
+    code = "import sys, models; assert 'app' not in sys.modules and 'flask_sqlalchemy' in sys.modules"
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)), check=True)
+
+
+def test_create_app_leaves_the_database_alone(tmp_path, monkeypatch):
+    database = tmp_path / 'app.db'
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{database}')
+    app = create_app('testing')
+    assert not database.exists()
+    with app.app_context():
+        initialize_database()
+        initialize_database()
+        assert User.query.filter_by(role='admin').count() == 1
+        db.drop_all()
@@ -0,0 +1,45 @@
+import pytest
+
+import config
+from app import create_app, initialize_database, session_store
+from models import db
+from tests.factories import login, make_student
+
+
+@pytest.fixture(params=['sql', 'memory'])
+def app(request, monkeypatch):
+    monkeypatch.setattr(config.TestingConfig, 'SESSION_BACKEND', request.param)
+    app = create_app('testing')
+    app.extensions['password_hasher'].method = 'pbkdf2:sha256:1000'
+    with app.app_context():
+        initialize_database()
+        make_student(1)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def session_id(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def test_login_and_logout_rotate_the_session_id(app, client):
+    # A wrong password flashes an error, which creates an anonymous session
+    login(client, 'student1@example.com', 'wrong')
+    planted = session_id(client)
+    with app.app_context():
+        assert planted and session_store().load(planted)
+
+    login(client, 'student1@example.com')
+    authenticated = session_id(client)
+    assert authenticated != planted
+    with app.app_context():
+        assert session_store().load(planted) is None
+        assert session_store().load(authenticated)[0]['user_id']
+
+    client.get('/logout')
+    assert session_id(client) != authenticated
+    with app.app_context():
+        assert session_store().load(authenticated) is None
@@ -0,0 +1,68 @@
+from app import paginate_tutors, search_tutors, upgrade_database
+from models import db, TeacherProfile
+from tests.factories import make_teacher
+
+
+def test_cursor_pages_cover_every_tutor_once_in_rank_order(app_context):
+    for i in range(7):
+        make_teacher(i, is_verified=i % 3 == 0, rating=4.5 if i % 2 else 5.0, hourly_rate=400 + 100 * (i % 2))
+    db.session.commit()
+    expected = [user.id for user in paginate_tutors(search_tutors(), per_page=100)[0]]
+    seen, after = [], None
+    while True:
+        tutors, after = paginate_tutors(search_tutors(), after=after, per_page=2)
+        seen += [user.id for user in tutors]
+        if not after:
+            break
+    assert seen == expected
+    assert len(seen) == 7
+
+
+def test_upgrade_backfills_null_rank_columns(app_context):
+    make_teacher(1)
+    db.session.commit()
+    with db.engine.begin() as connection:
+        # Recreate the column as it was before it became NOT NULL
+        connection.execute(db.text('DROP INDEX ix_teacher_profiles_rank'))
+        connection.execute(db.text('ALTER TABLE teacher_profiles DROP COLUMN rating'))
+        connection.execute(db.text('ALTER TABLE teacher_profiles ADD COLUMN rating FLOAT'))
+    upgrade_database()
+    db.session.expire_all()
+    assert TeacherProfile.query.one().rating == 5.0
+
+
+def search_ids(**filters):
+    return {user.id for user in search_tutors(**filters)}
+
+
+def test_city_matches_case_insensitively(app_context):
+    delhi, mumbai = make_teacher(1, city='New Delhi'), make_teacher(2, city='Mumbai')
+    db.session.commit()
+    assert search_ids(city=' new delhi ') == {delhi.id}
+    assert search_ids(city='MUMBAI') == {mumbai.id}
+
+
+def test_subject_matches_a_normalized_term(app_context):
+    science, english = make_teacher(1, subjects='Computer Science,physics'), make_teacher(2, subjects='english')
+    db.session.commit()
+    assert search_ids(subject='computer science') == {science.id}
+    assert search_ids(subject='English') == {english.id}
+    assert search_ids(subject='chemistry') == set()
+
+
+def test_mode_both_needs_home_tuition_and_online(app_context):
+    both = make_teacher(1, teaching_mode='home_tuition,online')
+    home = make_teacher(2, teaching_mode='home_tuition')
+    online = make_teacher(3, teaching_mode='online')
+    db.session.commit()
+    assert search_ids(mode='both') == {both.id}
+    assert search_ids(mode='online') == {both.id, online.id}
+    assert search_ids(mode='Home Tuition') == {both.id, home.id}
+
+
+def test_max_price_includes_the_limit(app_context):
+    cheap, exact = make_teacher(1, hourly_rate=300), make_teacher(2, hourly_rate=500)
+    make_teacher(3, hourly_rate=800)
+    db.session.commit()
+    assert search_ids(max_price=500) == {cheap.id, exact.id}
+    assert search_ids(max_price=299) == set()
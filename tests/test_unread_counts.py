@@ -0,0 +1,56 @@
+from sqlalchemy.exc import IntegrityError
+
+from app import get_admin_ids, get_unread_count, record_message
+from models import db, User
+from tests.factories import connect, make_student, make_teacher, make_user
+
+
+def test_unread_count_is_invalidated_on_commit(app, app_context):
+    student = make_student(1)
+    teacher = make_teacher(1)
+    connect(student, teacher)
+    db.session.commit()
+    cache = app.extensions['dashboard_cache']
+    assert get_unread_count(student.id) == 0
+
+    record_message(teacher.id, student.id, 'hello')
+    # A reader before the commit would cache the old count again; it must survive until the commit
+    assert cache.get(f'unread:{student.id}') == 0
+    db.session.commit()
+    assert get_unread_count(student.id) == 1
+
+    record_message(teacher.id, student.id, 'never sent')
+    db.session.rollback()
+    assert cache.get(f'unread:{student.id}') == 1
+
+
+def test_savepoints_keep_pending_invalidations(app, app_context):
+    student = make_student(1)
+    teacher = make_teacher(1)
+    connect(student, teacher)
+    db.session.commit()
+    cache = app.extensions['dashboard_cache']
+    assert get_unread_count(student.id) == 0
+
+    record_message(teacher.id, student.id, 'hello')
+    with db.session.begin_nested():
+        teacher.first_name = 'Renamed'
+    # Released savepoint: the message isn't committed yet, so the old count stays cached
+    assert cache.get(f'unread:{student.id}') == 0
+    try:
+        with db.session.begin_nested():
+            db.session.add(User(role='student', first_name='Dup', last_name='Test', email='student1@example.com', phone='1', password_hash='x'))
+    except IntegrityError:
+        pass
+    db.session.commit()
+    assert get_unread_count(student.id) == 1
+
+
+def test_admin_ids_are_refreshed_only_after_the_commit(app, app_context):
+    cache = app.extensions['dashboard_cache']
+    before = get_admin_ids()
+    admin = make_user('admin', 'admin@example.com')
+    # A reader before the commit must not re-cache the old set after it is dropped
+    assert cache.get('admin_ids') == before
+    db.session.commit()
+    assert get_admin_ids() == sorted(before + [admin.id])
@@ -0,0 +1,65 @@
+import hashlib
+import io
+import os
+from datetime import date
+
+import pytest
+
+from models import db, Job, PaymentCycle
+from tests.factories import connect, login, make_student, make_teacher
+from utils.uploads import process_image, save_image_upload
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def jpeg_bytes():
+    out = io.BytesIO()
+    Image.new('RGB', (800, 600), 'navy').save(out, 'JPEG')
+    return out.getvalue()
+
+
+def test_jpeg_original_is_not_overwritten(tmp_path):
+    data = jpeg_bytes()
+    original = save_image_upload(io.BytesIO(data), str(tmp_path), max_bytes=1024 * 1024)
+    image_path, thumbnail_path = process_image(original, str(tmp_path / 'thumbs'), max_dimension=400, thumbnail_size=100)
+    assert image_path != original
+    with open(original, 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == os.path.basename(original).split('.')[0]
+    with Image.open(image_path) as image:
+        assert max(image.size) == 400
+    with Image.open(thumbnail_path) as image:
+        assert max(image.size) == 100
+
+
+def test_processing_is_not_repeated(tmp_path):
+    original = save_image_upload(io.BytesIO(jpeg_bytes()), str(tmp_path), max_bytes=1024 * 1024)
+    first = process_image(original, str(tmp_path / 'thumbs'))
+    modified = os.path.getmtime(first[0])
+    # A repeat run on the original, or one on the already processed image
+    assert process_image(original, str(tmp_path / 'thumbs')) == first
+    assert process_image(first[0], str(tmp_path / 'thumbs')) == first
+    assert os.path.getmtime(first[0]) == modified
+
+
+def test_payment_upload_is_processed_by_the_web_process(app, client, tmp_path):
+    app.config['PAYMENT_UPLOAD_FOLDER'] = str(tmp_path)
+    with app.app_context():
+        student = make_student(1)
+        teacher = make_teacher(1)
+        connect(student, teacher)
+        cycle = PaymentCycle(student_id=student.id, teacher_id=teacher.id, start_date=date(2025, 1, 1), total_classes=25,
+                             total_amount=12500, commission=1250, teacher_earning=11250, status='pending_payment')
+        db.session.add(cycle)
+        db.session.commit()
+        cycle_id = cycle.id
+    login(client, 'student1@example.com')
+    response = client.post(f'/student/pay/{cycle_id}', data={'screenshot': (io.BytesIO(jpeg_bytes()), 'paid.jpg')})
+    assert response.status_code == 302
+    app.extensions['upload_pool'].shutdown(wait=True)
+    with app.app_context():
+        cycle = db.session.get(PaymentCycle, cycle_id)
+        assert cycle.status == 'pending_verification'
+        assert cycle.payment_thumbnail and os.path.exists(cycle.payment_thumbnail)
+        assert os.path.dirname(cycle.payment_thumbnail) == str(tmp_path / 'thumbs')
+        # Nothing is left for the worker, whose dyno can't see this upload
+        assert Job.query.count() == Job.query.filter(Job.periodic).count()
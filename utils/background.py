@@ -0,0 +1,40 @@
+"""A small per-process thread pool for work that must stay on this machine.
+
+Anything touching this dyno's filesystem (fresh uploads, say) can't go
+through the job queue: the worker dyno has its own disk and never sees
+the file. Work submitted here runs in the web process after the response.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundPool:
+
+    def __init__(self, workers=1, name='background'):
+        self.workers = workers
+        self.name = name
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool; returns its Future."""
+        return self._pool().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _pool(self):
+        # gunicorn --preload forks after create_app, and thread pools don't
+        # survive a fork, so each worker process builds its own on first use
+        if self._pid == os.getpid() and self._executor:
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid() or not self._executor:
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            return self._executor
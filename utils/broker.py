@@ -0,0 +1,67 @@
+"""In-process publish/subscribe used to wake chat polls waiting for new messages.
+
+Any object with the same publish()/subscribe() interface can replace
+LocalBroker (for example one backed by a local Redis), which is what lets
+several workers share one fan-out.
+"""
+import queue
+import threading
+
+
+class Subscription:
+    """A single listener on a channel, fed through a bounded queue."""
+
+    def __init__(self, broker, channel, max_queue_size):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(max_queue_size)
+
+    def get(self, timeout=None):
+        """Next payload, or None when nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBroker:
+    """Thread-safe fan-out to every subscriber of a channel in this process."""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(payload)
+            except queue.Full:
+                # Slow consumer: drop it; its next poll catches up from the database.
+                pass
+        return len(subscribers)
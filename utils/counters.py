@@ -0,0 +1,41 @@
+"""Process-local buffer of counter increments, written to storage in batches.
+
+Incrementing a shared counter row on every write serializes the writers on
+that row's lock. Summing increments here and writing the totals now and
+then turns many contended updates into one.
+"""
+import threading
+import time
+from datetime import datetime
+
+
+class CounterBuffer:
+    """Thread-safe pending deltas, one batch per committed transaction.
+
+    Each batch keeps the time it was committed, so the writer can leave
+    out deltas that a recount taken after that moment already includes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches = []
+        self._last_drain = time.monotonic()
+
+    def add(self, deltas, committed_at=None):
+        with self._lock:
+            self._batches.append((committed_at or datetime.utcnow(), dict(deltas)))
+
+    def restore(self, batches):
+        """Put drained batches back, e.g. after writing them failed."""
+        with self._lock:
+            self._batches[:0] = batches
+
+    def drain(self, min_interval=0):
+        """Take and clear the pending (committed_at, deltas) batches; [] if the last drain was under min_interval seconds ago."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._batches or now - self._last_drain < min_interval:
+                return []
+            batches, self._batches = self._batches, []
+            self._last_drain = now
+        return batches
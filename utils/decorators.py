@@ -1,26 +1,48 @@
-cat > utils/decorators.py << 'EOF'
+"""Route decorators for authentication and role checks."""
 from functools import wraps
-from flask import session, redirect, url_for, flash
+
+from flask import current_app, flash, jsonify, redirect, request, session, url_for
+
+
+def _deny(message, endpoint, status):
+    if request.is_json:
+        return jsonify({'error': message}), status
+    flash(message, 'error')
+    return redirect(url_for(endpoint))
+
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            flash('Please log in to access this page.', 'error')
-            return redirect(url_for('login'))
+            return _deny('Please login to access this page', 'login', 401)
         return f(*args, **kwargs)
     return decorated_function
 
-def role_required(role):
+
+def role_required(*roles):
+    """Let only logged-in users with one of `roles` through.
+
+    The role saved in the session at login is checked first, so wrong-role
+    requests are turned away without a database query. Otherwise the app's
+    registered user loader (app.extensions['user_loader']) fetches the user
+    and their profile in one joined query and caches them on g, where the
+    view picks them up again for free.
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            from models import get_user_by_id, UserRole
-            user = get_user_by_id(session.get('user_id'))
-            if not user or user.role != getattr(UserRole, role.upper()):
-                flash('Access denied.', 'error')
-                return redirect(url_for('home'))
+            if 'user_id' not in session:
+                return _deny('Please login to access this page', 'login', 401)
+            if session.get('user_role') not in roles:
+                return _deny('Access denied', 'home', 403)
+            user = current_app.extensions['user_loader']()
+            if user is None:
+                # The account behind this session no longer exists
+                session.clear()
+                return _deny('Please login to access this page', 'login', 401)
+            if user.role not in roles:
+                return _deny('Access denied', 'home', 403)
             return f(*args, **kwargs)
         return decorated_function
     return decorator
-EOF
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""Row serializers for the bulk data exports.
+
+Both formats are streamed as text chunks:
+
+- ``jsonl``: one JSON object per row.
+- ``columnar``: a header line naming the columns, then one line per block
+  of rows holding a list of values per column. Repeated keys are written
+  once per block instead of once per row, which keeps dumps compact and
+  quick to load into column-oriented tools.
+"""
+import json
+from datetime import date, datetime
+
+FORMATS = ('jsonl', 'columnar')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def dumps(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'))
+
+
+def iter_jsonl(columns, rows):
+    for row in rows:
+        yield dumps(dict(zip(columns, row))) + '\n'
+
+
+def iter_columnar(columns, rows, block_size=1000):
+    yield dumps({'format': 'columnar', 'version': 1, 'columns': columns}) + '\n'
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) >= block_size:
+            yield _columnar_block(columns, block)
+            block = []
+    if block:
+        yield _columnar_block(columns, block)
+
+
+def _columnar_block(columns, block):
+    return dumps({'rows': len(block), 'data': dict(zip(columns, (list(values) for values in zip(*block))))}) + '\n'
+
+
+def iter_rows(export_format, columns, rows):
+    if export_format == 'columnar':
+        return iter_columnar(columns, rows)
+    return iter_jsonl(columns, rows)
@@ -0,0 +1,83 @@
+"""Outbound SMTP over one long-lived connection per process.
+
+The job worker delivers every queued email through Mailer.send(). The
+first send opens an SMTP session and later ones reuse it, so a burst of
+notifications costs one connect, STARTTLS and login instead of one per
+message. Sends from the worker's threads take turns on the connection.
+A session the server has since dropped is reopened once; one left idle
+longer than idle_timeout is closed rather than held open.
+"""
+import smtplib
+import threading
+import time
+
+
+class Mailer:
+
+    def __init__(self, server, port, username=None, password=None, use_tls=True, idle_timeout=30.0, connect_timeout=10.0):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._connection = None
+        self._last_used = 0.0
+
+    def send(self, message):
+        """Deliver an email.message.Message; SMTP errors propagate so the caller's job is retried."""
+        with self._lock:
+            self._close_if_idle()
+            if self._connection is None:
+                self._connection = self._connect()
+                self._connection.send_message(message)
+            else:
+                try:
+                    self._connection.send_message(message)
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    # The server timed out or dropped the reused session; try once on a fresh one
+                    self._close()
+                    self._connection = self._connect()
+                    self._connection.send_message(message)
+            self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        """Close the connection if nothing has been sent for idle_timeout seconds."""
+        # A send holding the lock means the connection is anything but idle
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._close_if_idle()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close_if_idle(self):
+        if self._connection is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self._close()
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.server, self.port, timeout=self.connect_timeout)
+        try:
+            if self.use_tls:
+                connection.starttls()
+            if self.username and self.password:
+                connection.login(self.username, self.password)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
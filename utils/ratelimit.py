@@ -0,0 +1,119 @@
+"""Token-bucket rate limiting.
+
+A bucket holds up to `capacity` tokens and refills at `rate` tokens per
+second; each attempt takes one token and is refused while the bucket is
+empty. MemoryBackend keeps buckets in this process. A backend with the same
+take()/reset() interface backed by shared storage (RedisBackend, or your
+own) makes the limits hold across several workers.
+"""
+import threading
+import time
+
+
+class MemoryBackend:
+    """Buckets in a dict of key -> (tokens, last_update, full_at), pruned once full."""
+
+    def __init__(self, max_keys=100000, evict_interval=60.0):
+        self.max_keys = max_keys
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._next_eviction = time.monotonic() + evict_interval
+
+    def take(self, key, capacity, rate, cost=1):
+        """Take `cost` tokens; returns (allowed, seconds until enough tokens are back)."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_eviction or len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _evict(self, now):
+        # A bucket that has refilled is indistinguishable from a missing one
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        if len(self._buckets) >= self.max_keys:
+            # Still full of active keys: forget the half closest to refilling
+            pending = sorted(self._buckets.items(), key=lambda item: item[1][2])[len(self._buckets) // 2:]
+            self._buckets = dict(pending)
+        self._next_eviction = now + self.evict_interval
+
+
+class RedisBackend:
+    """Buckets in Redis, updated atomically by a Lua script so every worker shares them.
+
+    `client` is a redis.Redis instance; the redis package is only needed
+    when this backend is used.
+    """
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate, cost=1):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[capacity, rate, cost, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class RateLimiter:
+    """Named limits ('login_ip', ...) applied to keys on a shared backend."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.limits = {}
+
+    def add_limit(self, name, capacity, per_minute):
+        """Allow bursts of `capacity`, refilling at `per_minute` tokens a minute."""
+        self.limits[name] = (capacity, per_minute / 60.0)
+
+    def hit(self, name, key):
+        """Count an attempt; returns 0 when allowed, else seconds to wait before retrying."""
+        capacity, rate = self.limits[name]
+        allowed, retry_after = self.backend.take(f'{name}:{key}', capacity, rate)
+        return 0 if allowed else max(1, int(retry_after + 0.999))
+
+    def reset(self, name, key):
+        self.backend.reset(f'{name}:{key}')
+
+
+def create_backend(url=None):
+    """MemoryBackend, or RedisBackend for a redis:// URL."""
+    if not url:
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported rate limit storage: {url}')
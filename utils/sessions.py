@@ -0,0 +1,209 @@
+"""Server-side sessions: the cookie carries only an opaque id, the data lives in a store.
+
+The session is loaded lazily, on first access, so requests that never touch
+it (static files, anonymous pages) cost no store read, and it is written back
+only when modified or when a permanent session is due for a refresh. Stores
+implement load()/save()/delete()/delete_for_user()/cleanup(); MemorySessionStore
+is a process-local stand-in and SQLSessionStore keeps sessions in a table.
+"""
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+
+
+class ServerSideSession(SessionMixin):
+
+    def __init__(self, sid=None, loader=None):
+        self.sid = sid
+        self.had_cookie = sid is not None
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expires_at = None
+        self.replaced_sid = None
+        self._loader = loader
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        if self._data is None:
+            self.accessed = True
+            record = self._loader(self.sid) if self.sid and self._loader else None
+            if record is None:
+                # Unknown or expired id: start over with a fresh one on save
+                self.sid = None
+                self.new = True
+                self._data = {}
+            else:
+                self._data, self.expires_at = record
+        return self._data
+
+    def regenerate(self):
+        """Keep the data but move it to a fresh id when saved, deleting the old record.
+
+        Call when the user behind the session changes (login, logout) so an
+        id planted or leaked beforehand is worthless afterwards.
+        """
+        self._load()
+        if self.sid:
+            self.replaced_sid = self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def get(self, key, default=None):
+        return self._load().get(key, default)
+
+
+class MemorySessionStore:
+    """Sessions in a dict; for development and single-process deployments."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def load(self, sid):
+        with self._lock:
+            record = self._sessions.get(sid)
+        if record is None or record[2] < datetime.utcnow():
+            return None
+        return session_json_serializer.loads(record[0]), record[2]
+
+    def save(self, sid, data, user_id, expires_at):
+        with self._lock:
+            self._sessions[sid] = (session_json_serializer.dumps(data), user_id, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def delete_for_user(self, user_id):
+        with self._lock:
+            sids = [sid for sid, record in self._sessions.items() if record[1] == user_id]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+    def cleanup(self, batch_size=1000):
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [sid for sid, record in self._sessions.items() if record[2] < now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class SQLSessionStore:
+    """Sessions in a table with id, data, user_id and expires_at columns.
+
+    Uses its own short transactions on the engine so saving a session never
+    commits (or rolls back) the request's ORM session.
+    """
+
+    def __init__(self, engine, table):
+        self._engine = engine
+        self.table = table
+
+    @property
+    def engine(self):
+        # Accept a callable so the engine can be resolved inside an app context
+        return self._engine() if callable(self._engine) else self._engine
+
+    def load(self, sid):
+        table = self.table
+        with self.engine.connect() as connection:
+            row = connection.execute(table.select().where(table.c.id == sid, table.c.expires_at > datetime.utcnow())).first()
+        if row is None:
+            return None
+        return session_json_serializer.loads(row.data), row.expires_at
+
+    def save(self, sid, data, user_id, expires_at):
+        table = self.table
+        values = {'data': session_json_serializer.dumps(data), 'user_id': user_id, 'expires_at': expires_at}
+        with self.engine.begin() as connection:
+            if not connection.execute(table.update().where(table.c.id == sid).values(**values)).rowcount:
+                connection.execute(table.insert().values(id=sid, **values))
+
+    def delete(self, sid):
+        with self.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def delete_for_user(self, user_id):
+        with self.engine.begin() as connection:
+            return connection.execute(self.table.delete().where(self.table.c.user_id == user_id)).rowcount
+
+    def cleanup(self, batch_size=1000):
+        """Delete expired sessions in batches so no single statement holds locks for long."""
+        table = self.table
+        removed = 0
+        while True:
+            with self.engine.begin() as connection:
+                expired = table.select().with_only_columns(table.c.id).where(table.c.expires_at < datetime.utcnow()).limit(batch_size)
+                count = connection.execute(table.delete().where(table.c.id.in_(expired.scalar_subquery()))).rowcount
+            removed += count
+            if count < batch_size:
+                return removed
+
+
+class ServerSideSessionInterface(SessionInterface):
+
+    def __init__(self, store, user_key='user_id'):
+        self.store = store
+        self.user_key = user_key
+
+    def open_session(self, app, request):
+        return ServerSideSession(request.cookies.get(self.get_cookie_name(app)), self.store.load)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+            if session.had_cookie:
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+            return
+        response.vary.add('Cookie')
+        lifetime = app.permanent_session_lifetime if session.permanent else timedelta(days=1)
+        # Slide the expiry, but only rewrite an unmodified session once half its lifetime has gone
+        stale = session.expires_at is None or session.expires_at - datetime.utcnow() < lifetime / 2
+        if not (session.modified or session.new or stale):
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        expires_at = datetime.utcnow() + lifetime
+        self.store.save(session.sid, dict(session), session.get(self.user_key), expires_at)
+        response.set_cookie(name, session.sid, expires=expires_at if session.permanent else None,
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,122 @@
+"""Image uploads: chunked, size-capped saves under content-addressed names,
+plus the recompression and thumbnailing done afterwards on a background thread.
+
+Pillow is optional. Without it uploads are still validated and stored, but
+they are kept as uploaded and no thumbnail is made.
+"""
+import hashlib
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the image formats we accept, mapped to the extension we store
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+class UploadError(ValueError):
+    """The upload was rejected; the message is safe to show to the user."""
+
+
+def sniff_image_type(head):
+    """Extension for the image format `head` starts with, or None."""
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def save_image_upload(stream, directory, max_bytes):
+    """Copy an uploaded image to `directory` as <sha256>.<ext>, a chunk at a time.
+
+    Returns the saved path. An upload identical to one already stored reuses
+    the existing file. Raises UploadError for empty, oversized or non-image
+    uploads.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    extension = None
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = sniff_image_type(chunk)
+                    if extension is None:
+                        raise UploadError('Please upload a PNG, JPEG, GIF or WebP image.')
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f'Images must be smaller than {max_bytes // (1024 * 1024)} MB.')
+                digest.update(chunk)
+                out.write(chunk)
+        if not size:
+            raise UploadError('The uploaded file is empty.')
+        path = os.path.join(directory, f'{digest.hexdigest()}.{extension}')
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def derivative_paths(path, thumbnail_directory):
+    """(recompressed, thumbnail) paths for a stored upload or one of its derivatives.
+
+    Named after the upload's hash but never equal to it, so a JPEG original
+    is not overwritten and its bytes keep matching its name.
+    """
+    stem = os.path.basename(path).split('.', 1)[0]
+    return os.path.join(os.path.dirname(path), f'{stem}.display.jpg'), os.path.join(thumbnail_directory, f'{stem}.jpg')
+
+
+def process_image(path, thumbnail_directory, max_dimension=1600, thumbnail_size=320, quality=82):
+    """Recompress an upload to a bounded JPEG and write its thumbnail.
+
+    Returns (image_path, thumbnail_path); the caller removes the original
+    once nothing refers to it. Without Pillow the upload is left as is and
+    thumbnail_path is None. Derivatives that already exist are reused, so
+    re-uploads of the same image and repeated runs don't recompress it again.
+    """
+    if Image is None:
+        return path, None
+    image_path, thumbnail_path = derivative_paths(path, thumbnail_directory)
+    if not (os.path.exists(image_path) and os.path.exists(thumbnail_path)):
+        os.makedirs(thumbnail_directory, exist_ok=True)
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ('RGB', 'L'):
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.convert('RGBA').split()[-1])
+                image = background
+            image.thumbnail((max_dimension, max_dimension))
+            _save_jpeg(image, image_path, quality)
+            image.thumbnail((thumbnail_size, thumbnail_size))
+            _save_jpeg(image, thumbnail_path, quality)
+    return image_path, thumbnail_path
+
+
+def _save_jpeg(image, path, quality):
+    # Write beside the target and rename so readers never see a partial file
+    temp_path = f'{path}.part'
+    image.save(temp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(temp_path, path)
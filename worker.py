@@ -0,0 +1,53 @@
+"""Background job worker, run as the Procfile `worker` process.
+
+Claims due rows from the jobs table and runs them on a thread pool, each
+inside its own application context.
+"""
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import claim_jobs, create_app, requeue_stale_jobs, run_job, schedule_periodic_jobs
+
+app = create_app()
+
+stopping = threading.Event()
+
+
+def execute(job_id):
+    with app.app_context():
+        status = run_job(job_id)
+        app.logger.info('Job %s finished: %s', job_id, status)
+
+
+def main():
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    threads = app.config['JOB_WORKER_THREADS']
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, lambda *args: stopping.set())
+    print(f'Job worker {worker_id} started with {threads} threads')
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        in_flight = set()
+        while not stopping.is_set():
+            in_flight = {future for future in in_flight if not future.done()}
+            free = threads - len(in_flight)
+            job_ids = []
+            # Don't hold the SMTP session open between bursts of mail
+            app.extensions['mailer'].close_if_idle()
+            with app.app_context():
+                requeue_stale_jobs()
+                schedule_periodic_jobs()
+                if free > 0:
+                    job_ids = claim_jobs(worker_id, free)
+            for job_id in job_ids:
+                in_flight.add(pool.submit(execute, job_id))
+            if not job_ids:
+                stopping.wait(app.config['JOB_POLL_INTERVAL'])
+    app.extensions['mailer'].close()
+    print(f'Job worker {worker_id} stopped')
+
+
+if __name__ == '__main__':
+    main()